@@ -1,41 +1,91 @@
 from flask import Flask
-from db import init_db, close_db
-from routes.user_routes import user_bp
-from routes.product_routes import product_bp
-from routes.order_routes import order_bp
-from routes.admin_routes import admin_bp
-from routes.budget_routes import budget_bp
-from routes.pages_routes import pages_bp
+from db import DATABASE, init_db, close_db
 import os
 
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-change-this-in-production'  # Change this to a random secret key
-
 # Configure upload folder
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Create uploads directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Register blueprints
-app.register_blueprint(user_bp)
-app.register_blueprint(product_bp)
-app.register_blueprint(order_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(budget_bp)
-app.register_blueprint(pages_bp)
+def create_app(config=None):
+    """Build the Flask app. Blueprints and feature modules are imported here, when an app is created."""
+    from compression import init_compression
+    from streaming import init_streaming
+    from order_events import init_order_events
+    from order_outbox import init_order_outbox
+    from metrics import init_metrics
+    from request_profiler import init_request_profiler
+    from sql_profiler import init_sql_profiler
+    from image_pipeline import init_image_pipeline
+    from upload_store import init_upload_store
+    from template_cache import init_template_cache
+    from routes.user_routes import user_bp
+    from routes.product_routes import product_bp
+    from routes.order_routes import order_bp
+    from routes.admin_routes import admin_bp
+    from routes.budget_routes import budget_bp
+    from routes.pages_routes import pages_bp
+
+    app = Flask(__name__)
+    app.secret_key = 'your-secret-key-change-this-in-production'  # Change this to a random secret key
+
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    if config:
+        app.config.update(config)
+
+    # Create uploads directory if it doesn't exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    # Register blueprints
+    app.register_blueprint(user_bp)
+    app.register_blueprint(product_bp)
+    app.register_blueprint(order_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(budget_bp)
+    app.register_blueprint(pages_bp)
+
+    # Initialize database
+    init_db()
+
+    # Register teardown handler to close database connections
+    app.teardown_appcontext(close_db)
+
+    # Per-request query stats, slow-query log and N+1 warnings for get_db()
+    init_sql_profiler(app)
+
+    # Opt-in profiles of single requests (X-Profile header or sampling) into PROFILE_DIR
+    init_request_profiler(app)
 
-# Initialize database
-init_db()
+    # Request/SQL/cache/upload metrics on /metrics (Prometheus text format)
+    init_metrics(app)
 
-# Register teardown handler to close database connections
-app.teardown_appcontext(close_db)
+    # gzip/brotli responses and precompressed static files
+    init_compression(app)
+
+    # Long order listings are streamed in chunks while they render
+    init_streaming(app)
+
+    # Order status changes pushed to customers over SSE (/orders/events)
+    init_order_events(app, DATABASE)
+
+    # Notifications for order events, sent by a background consumer (transactional outbox)
+    init_order_outbox(app, DATABASE)
+
+    # Responsive WebP variants for uploaded product images
+    init_image_pipeline(app)
+
+    # Content-addressed uploads: long-cache headers and the gc-uploads command
+    init_upload_store(app)
+
+    app.context_processor(inject_wishlist_count)
+    app.add_url_rule('/', 'index', index)
+
+    # Bytecode cache + compile every template now, before workers fork and take traffic
+    init_template_cache(app)
+    return app
 
 
-@app.context_processor
 def inject_wishlist_count():
     from flask import session
     n = 0
@@ -48,7 +98,6 @@ def inject_wishlist_count():
             pass
     return {"wishlist_count": n}
 
-@app.route('/')
 def index():
     from flask import redirect, session
     if "admin_id" in session:
@@ -57,5 +106,9 @@ def index():
         return redirect('/dashboard')
     return redirect('/login')
 
+
+# Module-level app for `flask --app app`, gunicorn (app:app) and asgi.py
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,10 +1,12 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import asyncio
 import os
 import uuid
-import boto3
-from botocore.exceptions import ClientError
-from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
+from dynamo_store import DynamoStore
+from repository import DuplicateOrder, checkout_idempotency_key
+from metrics import init_metrics
+from notifications import FakePublisher, NotificationDispatcher, SnsPublisher
+from template_cache import init_template_cache
 
 # -------------------------------------------------
 # Flask App Configuration
@@ -14,19 +16,17 @@ app.secret_key = os.environ.get("FLASK_SECRET_KEY", "furnishfusion_secret_key")
 
 # -------------------------------------------------
 # AWS Configuration
+# (boto3 is imported and its clients built on first use, not at startup)
 # -------------------------------------------------
 AWS_REGION = "us-east-1"
 
-dynamodb = boto3.resource("dynamodb", region_name=AWS_REGION)
-sns = boto3.client("sns", region_name=AWS_REGION)
-
 # -------------------------------------------------
-# DynamoDB Tables (must exist in AWS)
+# DynamoDB Tables (create locally with `flask --app app_aws create-tables`)
 # -------------------------------------------------
-users_table = dynamodb.Table("FF_Users")
-admins_table = dynamodb.Table("FF_Admins")
-products_table = dynamodb.Table("FF_Products")
-orders_table = dynamodb.Table("FF_Orders")
+store = DynamoStore()
+
+# Admin dashboard shows the newest items only; older ones stay in DynamoDB
+ADMIN_RECENT_LIMIT = 50
 
 # -------------------------------------------------
 # SNS Topic ARN
@@ -40,23 +40,28 @@ UPLOAD_FOLDER = "static/uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
+# Request latency and DynamoDB cache hit/miss counters on /metrics
+init_metrics(app)
+
 
 # -------------------------------------------------
-# Helper: Send SNS Notification
+# Notifications: published by background workers, never in the request
+# (SNS_PUBLISHER=fake records them in memory for local testing)
 # -------------------------------------------------
+if os.environ.get("SNS_PUBLISHER") == "fake":
+    publisher = FakePublisher()
+else:
+    publisher = SnsPublisher(SNS_TOPIC_ARN, region_name=AWS_REGION)
+
+notifier = NotificationDispatcher(publisher).start()
+
+
 def send_notification(subject, message):
     """
-    Sends notification using AWS SNS.
-    Failure should not break application flow.
+    Queues a notification for asynchronous delivery.
+    Failure (or a full queue) should not break application flow.
     """
-    try:
-        sns.publish(
-            TopicArn=SNS_TOPIC_ARN,
-            Subject=subject,
-            Message=message
-        )
-    except ClientError as e:
-        print("SNS Error:", e)
+    notifier.notify(subject, message)
 
 
 # =================================================
@@ -82,12 +87,13 @@ def signup():
         password = request.form["password"]
 
         # Check if user already exists
-        if "Item" in users_table.get_item(Key={"username": username}):
+        if store.get_user(username):
             return "User already exists"
 
+        from werkzeug.security import generate_password_hash
         hashed_password = generate_password_hash(password)
 
-        users_table.put_item(Item={
+        store.create_user({
             "username": username,
             "password": hashed_password
         })
@@ -108,11 +114,10 @@ def login():
         username = request.form["username"]
         password = request.form["password"]
 
-        response = users_table.get_item(Key={"username": username})
+        user = store.find_user_for_login(username)
 
-        if "Item" in response and check_password_hash(
-            response["Item"]["password"], password
-        ):
+        from werkzeug.security import check_password_hash
+        if user and check_password_hash(user["password"], password):
             session["user"] = username
             return redirect(url_for("home"))
 
@@ -135,13 +140,13 @@ def home():
     if "user" not in session:
         return redirect(url_for("login"))
 
-    products = products_table.scan().get("Items", [])
+    products = store.list_products()
     return render_template("home.html", products=products)
 
 
 @app.route("/products")
 def products():
-    products = products_table.scan().get("Items", [])
+    products = store.list_products(category=request.args.get("category") or None)
     return render_template("products.html", products=products)
 
 
@@ -153,15 +158,20 @@ def place_order(product_id):
     if "user" not in session:
         return redirect(url_for("login"))
 
-    order_id = str(uuid.uuid4())
+    product = store.get_product(product_id)
+    if not product:
+        return redirect(url_for("products"))
 
-    orders_table.put_item(Item={
-        "order_id": order_id,
-        "username": session["user"],
-        "product_id": product_id,
-        "status": "PLACED"
-        # TODO: Add address, payment_mode, timestamp
-    })
+    order_id = store.create_order(
+        {
+            "username": session["user"],
+            "product_id": product_id,
+            "total": product.get("price"),
+            "status": "PLACED"
+            # TODO: Add address, payment_mode
+        },
+        [{"product_id": product_id, "quantity": 1, "price": product.get("price")}],
+    )
 
     send_notification(
         "New Order",
@@ -171,6 +181,105 @@ def place_order(product_id):
     return redirect(url_for("home"))
 
 
+# =================================================
+# CART & CHECKOUT
+# =================================================
+@app.route("/add-to-cart/<product_id>", methods=["POST"])
+def add_to_cart(product_id):
+    if not store.get_product(product_id):
+        return redirect(url_for("products"))
+    cart = session.get("cart", {})
+    cart[product_id] = cart.get(product_id, 0) + 1
+    session["cart"] = cart
+    return redirect(url_for("products"))
+
+
+def _cart_items(cart):
+    """Price the session cart with one batch_get_item call."""
+    products = store.batch_get_products(cart.keys())
+    cart_items = []
+    for product_id, quantity in cart.items():
+        product = products.get(product_id)
+        if product:
+            price = float(product.get("price") or 0)
+            cart_items.append({
+                "id": product_id,
+                "product": product,
+                "name": product.get("name"),
+                "description": product.get("description"),
+                "image_url": product.get("image_url"),
+                "price": price,
+                "quantity": quantity,
+                "total": price * quantity,
+            })
+    return cart_items
+
+
+@app.route("/cart")
+def cart():
+    cart_items = _cart_items(session.get("cart", {}))
+    return render_template("cart.html", cart_items=cart_items, total=sum(i["total"] for i in cart_items))
+
+
+@app.route("/checkout")
+def checkout():
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    cart_items = _cart_items(session.get("cart", {}))
+    if not cart_items:
+        return redirect(url_for("cart"))
+
+    # One key per rendered checkout; a double-submitted or retried form reuses it
+    return render_template(
+        "checkout.html",
+        cart_items=cart_items,
+        total=sum(i["total"] for i in cart_items),
+        applied_coupon=None,
+        upi_qr=None,
+        idempotency_key=uuid.uuid4().hex,
+    )
+
+
+@app.route("/place-order", methods=["POST"])
+def place_cart_order():
+    if "user" not in session:
+        return redirect(url_for("login"))
+
+    cart_items = _cart_items(session.get("cart", {}))
+    if not cart_items:
+        return redirect(url_for("cart"))
+
+    idempotency_key = checkout_idempotency_key(
+        request.headers.get("Idempotency-Key") or request.form.get("idempotency_key"), session.get("cart", {})
+    )
+    try:
+        order_id = store.create_order(
+            {
+                "username": session["user"],
+                "total": round(sum(i["total"] for i in cart_items), 2),
+                "status": "PLACED",
+                "contact_mobile": request.form.get("contact_mobile", ""),
+                "contact_address": request.form.get("contact_address", ""),
+                "payment_method": request.form.get("payment_method", "cod"),
+            },
+            [{"product_id": i["id"], "quantity": i["quantity"], "price": i["price"]} for i in cart_items],
+            idempotency_key=idempotency_key,
+        )
+    except DuplicateOrder:
+        # The same form was already submitted with this cart: the order and its
+        # notification exist, so there is nothing left to do
+        return redirect(url_for("home"))
+    session["cart"] = {}
+
+    send_notification(
+        "New Order",
+        f"Order {order_id} ({len(cart_items)} item(s)) placed by {session['user']}"
+    )
+
+    return redirect(url_for("home"))
+
+
 # =================================================
 # ADMIN AUTHENTICATION
 # =================================================
@@ -180,11 +289,10 @@ def admin_login():
         username = request.form["username"]
         password = request.form["password"]
 
-        response = admins_table.get_item(Key={"username": username})
+        admin = store.get_admin(username)
 
-        if "Item" in response and check_password_hash(
-            response["Item"]["password"], password
-        ):
+        from werkzeug.security import check_password_hash
+        if admin and check_password_hash(admin["password"], password):
             session["admin"] = username
             return redirect(url_for("admin_dashboard"))
 
@@ -203,12 +311,15 @@ def admin_logout():
 # ADMIN DASHBOARD
 # =================================================
 @app.route("/admin/dashboard")
-def admin_dashboard():
+async def admin_dashboard():
     if "admin" not in session:
         return redirect(url_for("admin_login"))
 
-    products = products_table.scan().get("Items", [])
-    orders = orders_table.scan().get("Items", [])
+    # Independent DynamoDB queries: wait for both at once instead of back to back
+    products, orders = await asyncio.gather(
+        asyncio.to_thread(store.list_products, limit=ADMIN_RECENT_LIMIT),
+        asyncio.to_thread(store.list_orders, limit=ADMIN_RECENT_LIMIT),
+    )
 
     return render_template(
         "admin_dashboard.html",
@@ -217,6 +328,13 @@ def admin_dashboard():
     )
 
 
+@app.route("/admin/notifications")
+def notification_metrics():
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    return jsonify(notifier.metrics())
+
+
 # =================================================
 # ADMIN: ADD PRODUCT
 # =================================================
@@ -231,12 +349,13 @@ def add_product():
         description = request.form["description"]
         image = request.files["image"]
 
+        from werkzeug.utils import secure_filename
         image_name = secure_filename(image.filename)
         image.save(os.path.join(app.config["UPLOAD_FOLDER"], image_name))
 
         product_id = str(uuid.uuid4())
 
-        products_table.put_item(Item={
+        store.create_product({
             "product_id": product_id,
             "name": name,
             "price": price,
@@ -255,6 +374,26 @@ def add_product():
     return render_template("add_product.html")
 
 
+# =================================================
+# CLI: TABLE SETUP
+# =================================================
+@app.cli.command("create-tables")
+def create_tables_command():
+    """Create the FF_* tables and indexes (e.g. against DynamoDB Local)."""
+    created = store.create_tables()
+    print("Created: " + (", ".join(created) if created else "nothing, all tables exist"))
+
+
+@app.cli.command("backfill-indexes")
+def backfill_indexes_command():
+    """Tag pre-existing products/orders so they show up in the list indexes."""
+    print(f"Updated {store.backfill_index_attributes()} item(s)")
+
+
+# Bytecode cache + compile every template now, before workers fork and take traffic
+init_template_cache(app)
+
+
 # =================================================
 # APP ENTRY POINT
 # =================================================
@@ -0,0 +1,44 @@
+"""
+ASGI entry point for FurnishFusion.
+
+    uvicorn asgi:application           # SQLite app (app.py)
+    uvicorn asgi:aws_application       # DynamoDB/SNS app (app_aws.py)
+
+The Flask apps are WSGI apps, served through a2wsgi's ``WSGIMiddleware``.
+Each request runs on its pool of ``ASGI_THREADS`` threads (default 40)
+while the event loop does the socket I/O, so slow requests run side by
+side as they do under gunicorn's gthread workers. Views that wait on
+several independent AWS calls are ``async def`` and await them
+concurrently (see app_aws.admin_dashboard).
+
+Request bodies reach ``wsgi.input`` as they arrive, so an upload that is
+too large is rejected before the rest of it is sent (upload_store.py).
+Response chunks are sent as the view yields them, so Server-Sent Events
+reach the browser. The server does not tell the view that a client went
+away: an order-events stream of a closed tab keeps its thread until
+``ORDER_EVENTS_STREAM_SECONDS`` is up. Measurements against gunicorn are
+in bench/loadtest.py.
+
+Each app is imported on first access only, so serving one does not create
+the other's tables or AWS clients.
+"""
+
+import os
+
+from a2wsgi import WSGIMiddleware
+
+_APPS = {
+    "application": "app",
+    "aws_application": "app_aws",
+}
+
+
+def __getattr__(name):
+    if name not in _APPS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    threads = int(os.environ.get("ASGI_THREADS", 40))
+    os.environ["SERVER_THREADS"] = str(threads)  # sizes ORDER_EVENTS_MAX_STREAMS
+    module = __import__(_APPS[name])
+    application = WSGIMiddleware(module.app, workers=threads)
+    globals()[name] = application
+    return application
@@ -0,0 +1,170 @@
+"""
+Checkout race: many buyers try to buy the last units of one product at the
+same moment.
+
+Seeds a scratch database, gives one product ``--stock`` units, logs in
+``--workers`` x ``--threads`` buyers (separate processes, each with its own
+SQLite connections, like gunicorn workers) and releases them together on
+``/place-order``. Every buyer then cancels the order it got, again all at
+once. It checks that:
+
+* exactly ``stock // quantity`` orders were placed and the rest were told
+  the product is sold out (no oversell, no stock below zero),
+* no checkout failed with an error (a lock timeout or deadlock shows up
+  as "An error occurred"),
+* cancelling every order puts the stock back where it started.
+
+    python bench/checkout_race.py
+    python bench/checkout_race.py --workers 8 --threads 8 --stock 10 --quantity 2
+
+Exits 1 when a check fails.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "bench123"
+
+
+def flashes(client):
+    with client.session_transaction() as sess:
+        return [message for _, message in sess.get("_flashes", [])]
+
+
+def buyer(app, user_n, args, start, cancel, results):
+    client = app.test_client()
+    client.post("/login", data={"email": f"user{user_n}@bench.local", "password": PASSWORD})
+    for _ in range(args.quantity):
+        client.post(f"/add-to-cart/{args.product}")
+    flashes(client)  # drop the login/cart messages
+
+    start.wait()
+    started = time.perf_counter()
+    response = client.post("/place-order", data={
+        "payment_method": "cod",
+        "contact_mobile": "9876543210",
+        "contact_address": "1 Bench Street",
+    })
+    elapsed = time.perf_counter() - started
+    messages = flashes(client)
+    match = re.search(r"Order ID: #(\d+)", " ".join(messages))
+    if response.location == "/orders" and match:
+        outcome = "placed"
+    elif any("not enough stock" in m for m in messages):
+        outcome = "sold out"
+    else:
+        outcome = "error: " + "; ".join(messages)
+
+    cancel.wait()
+    if match:
+        client.post(f"/cancel-order/{match.group(1)}")
+    results.put((outcome, elapsed))
+
+
+def worker(first_user, args, start, cancel, results):
+    os.environ["FURNISHFUSION_DB"] = args.db
+    os.environ["TEMPLATE_WARMUP"] = "0"
+    os.environ["ORDER_OUTBOX"] = "0"
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from app import app
+    # Waiting for the write lock is expected here; keep the slow-query log quiet
+    logging.getLogger("sql_profiler").setLevel(logging.ERROR)
+    threads = [
+        threading.Thread(target=buyer, args=(app, first_user + i, args, start, cancel, results))
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def stock(db_path, product_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT stock FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=6, help="buyer processes")
+    parser.add_argument("--threads", type=int, default=6, help="buyers per process")
+    parser.add_argument("--stock", type=int, default=10)
+    parser.add_argument("--quantity", type=int, default=1, help="units each buyer orders")
+    parser.add_argument("--product", type=int, default=1)
+    args = parser.parse_args()
+
+    buyers = args.workers * args.threads
+    work = tempfile.mkdtemp(prefix="ff-race-")
+    args.db = os.path.join(work, "race.db")
+    try:
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, "bench", "seed.py"), args.db,
+             "--users", str(buyers), "--products", "5", "--orders", "0", "--reviews", "0"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        conn = sqlite3.connect(args.db)
+        conn.execute("UPDATE products SET stock = ? WHERE id = ?", (args.stock, args.product))
+        conn.commit()
+        conn.close()
+
+        # Every buyer is logged in with a full cart before the barrier opens
+        start = multiprocessing.Barrier(buyers)
+        cancel = multiprocessing.Barrier(buyers)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(1 + w * args.threads, args, start, cancel, results))
+            for w in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=120) for _ in range(buyers)]
+        for process in processes:
+            process.join()
+        final_stock = stock(args.db, args.product)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    placed = sum(1 for outcome, _ in outcomes if outcome == "placed")
+    sold_out = sum(1 for outcome, _ in outcomes if outcome == "sold out")
+    errors = [outcome for outcome, _ in outcomes if outcome.startswith("error")]
+    latencies = sorted(elapsed * 1000 for _, elapsed in outcomes)
+    expected = min(buyers, args.stock // args.quantity)
+
+    print(f"{buyers} buyers ({args.workers} processes x {args.threads} threads), "
+          f"stock {args.stock}, {args.quantity} unit(s) each")
+    print(f"placed {placed}, sold out {sold_out}, errors {len(errors)}")
+    print(f"checkout ms: median {statistics.median(latencies):.1f}, max {latencies[-1]:.1f}")
+    print(f"stock after cancelling every order: {final_stock} (started at {args.stock})")
+
+    failures = []
+    if placed != expected:
+        failures.append(f"placed {placed} orders, expected {expected}")
+    if errors:
+        failures.append(f"{len(errors)} checkout(s) failed, e.g. {errors[0]}")
+    if final_stock != args.stock:
+        failures.append(f"stock is {final_stock} after cancelling, expected {args.stock}")
+    for failure in failures:
+        print("FAIL:", failure)
+    if not failures:
+        print("OK: no oversell, no failed checkouts, stock restored")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Benchmark runner: replays bench/scenarios.py and reports per-route latency.
+
+    python bench/seed.py                          # once: bench/bench.db
+    python bench/run.py                           # in-process, all scenarios
+    python bench/run.py --save-baseline           # record bench/baseline.json
+    python bench/run.py                           # ...later: compare against it
+
+By default the app runs in this process on the Flask test client. That
+measures the application without network or server overhead and is the
+most repeatable mode. To measure a real deployment instead, start it on
+the benchmark database and pass ``--url``:
+
+    FURNISHFUSION_DB=bench/bench.db gunicorn -c gunicorn.conf.py
+    python bench/run.py --url http://127.0.0.1:8000 --workers 16
+
+Each worker thread has its own client (and session) and runs every
+selected scenario once per iteration. The report lists, per route label,
+the request count, errors (4xx/5xx), throughput, and p50/p95/p99. With a
+baseline present, a route whose p95 grew by more than ``--tolerance``
+(and by at least ``--min-delta-ms``) counts as a regression, and the
+runner exits with status 1.
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.join(ROOT, "bench")
+sys.path.insert(0, ROOT)
+
+from loadtest import percentile  # noqa: E402
+from scenarios import SCENARIOS  # noqa: E402
+from seed import seed  # noqa: E402
+
+DEFAULT_DB = os.path.join(BENCH, "bench.db")
+DEFAULT_BASELINE = os.path.join(BENCH, "baseline.json")
+
+
+# -------------------------------------------------
+# Clients
+# -------------------------------------------------
+class _Client:
+    def __init__(self, samples):
+        self.samples = samples  # shared list of (label, seconds, status)
+        self.state = {}
+
+    def request(self, label, method, path, data=None, json=None):
+        started = time.perf_counter()
+        try:
+            status = self._send(method, path, data, json)
+        except Exception as e:
+            status = type(e).__name__
+        self.samples.append((label, time.perf_counter() - started, status))
+        return status
+
+
+class InProcessClient(_Client):
+    def __init__(self, app, samples):
+        super().__init__(samples)
+        self.client = app.test_client()
+
+    def _send(self, method, path, data, json):
+        response = self.client.open(path, method=method, data=data, json=json)
+        response.get_data()  # streamed pages render while the body is read
+        response.close()
+        return response.status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # time each request on its own; redirects count as success
+
+
+class HttpClient(_Client):
+    def __init__(self, base_url, samples):
+        super().__init__(samples)
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def _send(self, method, path, data, json_body):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+# -------------------------------------------------
+# Running
+# -------------------------------------------------
+def load_context(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            "users": conn.execute("SELECT COUNT(*) FROM users WHERE email LIKE '%@bench.local'").fetchone()[0],
+            "product_ids": [r[0] for r in conn.execute("SELECT id FROM products")],
+            "categories": [r[0] for r in conn.execute(
+                "SELECT DISTINCT category FROM products WHERE category IS NOT NULL")],
+        }
+    finally:
+        conn.close()
+
+
+def make_client_factory(args):
+    if args.url:
+        return lambda samples: HttpClient(args.url, samples)
+    os.environ["FURNISHFUSION_DB"] = args.db
+    os.chdir(ROOT)
+    from app import create_app
+    app = create_app()
+    return lambda samples: InProcessClient(app, samples)
+
+
+def run(args):
+    ctx = load_context(args.db)
+    if not ctx["users"]:
+        sys.exit(f"{args.db} has no bench users; seed it with bench/seed.py")
+    scenarios = [SCENARIOS[name] for name in args.scenarios]
+    new_client = make_client_factory(args)
+
+    def worker(n, samples, iterations):
+        rng = random.Random(args.seed * 1000 + n)
+        client = new_client(samples)
+        for _ in range(iterations):
+            for scenario in scenarios:
+                scenario(client, rng, ctx)
+
+    def run_workers(iterations):
+        samples = []
+        threads = [threading.Thread(target=worker, args=(n, samples, iterations)) for n in range(args.workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+    if args.warmup:
+        run_workers(args.warmup)
+    return run_workers(args.iterations)
+
+
+def summarize(samples, elapsed):
+    routes = {}
+    for label, seconds, status in samples:
+        routes.setdefault(label, {"ms": [], "errors": 0})
+        entry = routes[label]
+        if isinstance(status, int) and status < 400:
+            entry["ms"].append(seconds * 1000)
+        else:
+            entry["errors"] += 1
+    summary = {}
+    for label, entry in sorted(routes.items()):
+        ms = entry["ms"]
+        summary[label] = {
+            "count": len(ms),
+            "errors": entry["errors"],
+            "rps": round(len(ms) / elapsed, 2),
+            "p50": round(percentile(ms, 50), 3),
+            "p95": round(percentile(ms, 95), 3),
+            "p99": round(percentile(ms, 99), 3),
+        }
+    return summary
+
+
+def report(summary, elapsed, baseline=None, tolerance=0.2, min_delta_ms=1.0):
+    """Print the table; returns the labels that regressed against ``baseline``."""
+    total = sum(r["count"] for r in summary.values())
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+    header = f"{'route':38} {'count':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    if baseline:
+        header += f" {'p95 vs base':>12}"
+    print(header)
+    regressions = []
+    for label, r in summary.items():
+        line = (f"{label:38} {r['count']:6d} {r['errors']:4d} {r['rps']:8.1f} "
+                f"{r['p50']:8.2f} {r['p95']:8.2f} {r['p99']:8.2f}")
+        base = (baseline or {}).get(label)
+        if base and base["p95"]:
+            change = (r["p95"] - base["p95"]) / base["p95"]
+            flag = ""
+            if change > tolerance and r["p95"] - base["p95"] >= min_delta_ms:
+                regressions.append(label)
+                flag = "  REGRESSION"
+            line += f" {change:+11.0%}{flag}"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB, help="benchmark database (seeded if missing)")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS),
+                        help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=25, help="scenario rounds per worker")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed rounds per worker first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.db = os.path.abspath(args.db)
+    if not args.url and not os.path.exists(args.db):
+        print(f"seeding {args.db} ...")
+        seed(args.db)
+
+    samples, elapsed = run(args)
+    summary = summarize(samples, elapsed)
+    result = {
+        "meta": {
+            "mode": args.url or "in-process",
+            "scenarios": args.scenarios,
+            "workers": args.workers,
+            "iterations": args.iterations,
+            "elapsed": round(elapsed, 3),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "routes": summary,
+    }
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["routes"]
+    regressions = report(summary, elapsed, baseline, args.tolerance, args.min_delta_ms)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nbaseline saved to {args.baseline}")
+    if regressions:
+        print(f"\np95 regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Scripted user journeys for bench/run.py.
+
+Each scenario takes a client (in-process or HTTP, see run.py), a seeded
+``random.Random`` and the context read from the benchmark database. It
+issues requests through ``client.request(label, method, path, ...)``.
+Labels group the timings per route in the report, so query-string
+variants of one route get their own label.
+"""
+
+from seed import USER_PASSWORD, user_email
+
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "admin123"
+
+BUDGET_MESSAGES = [
+    "I have 50000 to furnish my bedroom",
+    "Budget of 120000 for the living room",
+    "Setting up my office with 40000",
+]
+
+
+def ensure_user(client, rng, ctx):
+    if client.state.get("user") is None:
+        n = rng.randint(1, ctx["users"])
+        client.request("POST /login", "POST", "/login", data={"email": user_email(n), "password": USER_PASSWORD})
+        client.state["user"] = n
+
+
+def ensure_admin(client):
+    if not client.state.get("admin"):
+        client.request("POST /admin/login", "POST", "/admin/login",
+                       data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+        client.state["admin"] = True
+
+
+def browse(client, rng, ctx):
+    client.request("GET /products", "GET", "/products")
+    category = rng.choice(ctx["categories"])
+    client.request("GET /products?category&sort", "GET", f"/products?category={category}&sort=price_asc")
+    low = rng.randrange(2000, 40000, 1000)
+    client.request("GET /products?min_price&max_price", "GET", f"/products?min_price={low}&max_price={low + 20000}")
+    client.request("GET /products?min_rating&sort", "GET", "/products?min_rating=3&sort=rating_desc")
+
+
+def _fill_cart(client, rng, ctx, items):
+    for product_id in rng.sample(ctx["product_ids"], items):
+        client.request("POST /add-to-cart/<id>", "POST", f"/add-to-cart/{product_id}")
+
+
+def cart(client, rng, ctx):
+    ensure_user(client, rng, ctx)
+    _fill_cart(client, rng, ctx, 3)
+    client.request("GET /cart", "GET", "/cart")
+
+
+def checkout(client, rng, ctx):
+    ensure_user(client, rng, ctx)
+    _fill_cart(client, rng, ctx, 2)
+    client.request("GET /checkout", "GET", "/checkout")
+    client.request("POST /place-order", "POST", "/place-order", data={
+        "payment_method": "cod",
+        "contact_mobile": "9876543210",
+        "contact_address": "42 Bench Street",
+    })
+
+
+def orders(client, rng, ctx):
+    ensure_user(client, rng, ctx)
+    client.request("GET /orders", "GET", "/orders")
+    client.request("GET /dashboard", "GET", "/dashboard")
+
+
+def admin(client, rng, ctx):
+    ensure_admin(client)
+    client.request("GET /admin/dashboard", "GET", "/admin/dashboard")
+    client.request("GET /admin/orders", "GET", "/admin/orders")
+    client.request("GET /admin/products", "GET", "/admin/products")
+
+
+def budget(client, rng, ctx):
+    client.request("POST /budget-planner", "POST", "/budget-planner", json={"message": rng.choice(BUDGET_MESSAGES)})
+
+
+SCENARIOS = {
+    "browse": browse,
+    "cart": cart,
+    "checkout": checkout,
+    "orders": orders,
+    "admin": admin,
+    "budget": budget,
+}
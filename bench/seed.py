@@ -0,0 +1,131 @@
+"""
+Seed a benchmark database with synthetic users, products, orders and reviews.
+
+    python bench/seed.py bench/bench.db --users 1000 --products 500 --orders 5000 --reviews 3000
+
+The same ``--seed`` always produces the same rows, so runs are comparable.
+The schema comes from ``db.init_db``, exactly as the app creates it. Seeded
+users log in as ``user<N>@bench.local`` / ``bench123`` and the admin as
+``admin`` / ``admin123``. Point the app at the file with
+``FURNISHFUSION_DB=bench/bench.db``.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USER_PASSWORD = "bench123"
+ORDER_STATUSES = ["pending", "accepted", "processing", "shipped", "delivered", "completed", "cancelled"]
+CATEGORIES = {
+    "Sofa": ["Sofa", "Couch", "Settee"],
+    "Bed": ["Queen Bed", "King Bed", "Single Bed", "Bed Frame"],
+    "Mattress": ["Mattress"],
+    "Table": ["Coffee Table", "Side Table", "Center Table", "Dining Table"],
+    "Chair": ["Office Chair", "Dining Chair", "Ergonomic Chair"],
+    "Desk": ["Study Desk", "Writing Desk"],
+    "Storage": ["Bookshelf", "Wardrobe", "Cabinet", "TV Unit"],
+}
+ADJECTIVES = ["Modern", "Classic", "Rustic", "Oak", "Walnut", "Teak", "Minimal", "Velvet", "Compact", "Royal"]
+
+
+def user_email(n):
+    return f"user{n}@bench.local"
+
+
+def _timestamp(rng, now, days=365):
+    return (now - timedelta(seconds=rng.randrange(days * 86400))).isoformat(sep=" ", timespec="seconds")
+
+
+def seed(path, users=1000, products=500, orders=5000, reviews=3000, random_seed=42):
+    """Create ``path`` (which must not exist) and fill it. Returns the row counts."""
+    import db
+    db.DATABASE = path
+    db.init_db()  # schema, default admin, contact info and sample products
+
+    rng = random.Random(random_seed)
+    now = datetime(2025, 1, 1)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executemany(
+            "INSERT INTO users (name, email, password, created_at) VALUES (?, ?, ?, ?)",
+            [(f"Bench User {n}", user_email(n), USER_PASSWORD, _timestamp(rng, now)) for n in range(1, users + 1)],
+        )
+        product_rows = []
+        for n in range(products):
+            category = rng.choice(list(CATEGORIES))
+            name = f"{rng.choice(ADJECTIVES)} {rng.choice(CATEGORIES[category])} {n}"
+            product_rows.append((
+                name,
+                f"{name}: synthetic product for benchmarks. " * 3,
+                float(rng.randrange(2000, 90000, 500)),
+                None,
+                category,
+                _timestamp(rng, now),
+            ))
+        conn.executemany(
+            "INSERT INTO products (name, description, price, image_url, category, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            product_rows,
+        )
+
+        user_ids = [r[0] for r in conn.execute("SELECT id FROM users")]
+        prices = dict(conn.execute("SELECT id, price FROM products"))
+        product_ids = list(prices)
+
+        for _ in range(orders):
+            lines = [(pid, rng.randint(1, 3)) for pid in rng.sample(product_ids, rng.randint(1, 4))]
+            created = _timestamp(rng, now)
+            cursor = conn.execute(
+                """INSERT INTO orders (user_id, total, status, payment_method, payment_status,
+                                       contact_mobile, contact_address, created_at, updated_at)
+                   VALUES (?, ?, ?, 'cod', 'pending', '9876543210', 'Bench Street', ?, ?)""",
+                (rng.choice(user_ids), sum(prices[pid] * qty for pid, qty in lines),
+                 rng.choice(ORDER_STATUSES), created, created),
+            )
+            conn.executemany(
+                "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                [(cursor.lastrowid, pid, qty, prices[pid]) for pid, qty in lines],
+            )
+
+        pairs = set()
+        while len(pairs) < min(reviews, len(user_ids) * len(product_ids)):
+            pairs.add((rng.choice(user_ids), rng.choice(product_ids)))
+        conn.executemany(
+            "INSERT INTO product_reviews (user_id, product_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(uid, pid, rng.randint(1, 5), "Bench review", _timestamp(rng, now)) for uid, pid in sorted(pairs)],
+        )
+        conn.commit()
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("users", "products", "orders", "order_items", "product_reviews")
+        }
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default=os.path.join(ROOT, "bench", "bench.db"))
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--reviews", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="replace an existing file")
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            parser.error(f"{args.path} exists (use --force to replace it)")
+        os.remove(args.path)
+    counts = seed(args.path, args.users, args.products, args.orders, args.reviews, args.seed)
+    print(f"seeded {args.path}: " + ", ".join(f"{n} {table}" for table, n in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark: how long importing each app module takes.
+
+Runs ``python -X importtime -c "import <module>"`` in fresh interpreters
+from the repository root and reports the median wall time plus the
+modules with the largest cumulative import time:
+
+    python bench/startup.py                      # app and app_aws
+    python bench/startup.py app --runs 10 --top 15
+    python bench/startup.py app --budget-ms 400  # exit 1 if slower (for CI)
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = (
+    "import time; started = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - started) * 1000)"
+)
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SNIPPET.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def run(module, runs, top):
+    wall_ms = []
+    samples = []
+    for _ in range(runs):
+        elapsed, modules = measure(module)
+        wall_ms.append(elapsed)
+        samples.append(modules)
+
+    print(f"{module}: median {statistics.median(wall_ms):.0f} ms "
+          f"(min {min(wall_ms):.0f}, max {max(wall_ms):.0f}) over {runs} runs")
+    # Median cumulative time per module across runs; top-level packages only
+    names = {name for modules in samples for name in modules if "." not in name}
+    cumulative = {
+        name: statistics.median(modules.get(name, (0, 0))[1] for modules in samples) / 1000
+        for name in names
+    }
+    for name, ms in sorted(cumulative.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {ms:8.1f} ms  {name}")
+    return statistics.median(wall_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=["app", "app_aws"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="fail if a module's median exceeds this")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        median = run(module, args.runs, args.top)
+        if args.budget_ms is not None and median > args.budget_ms:
+            over_budget.append(module)
+        print()
+    if over_budget:
+        print(f"over the {args.budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Template compile benchmark: what the Jinja bytecode cache saves.
+
+For every template under templates/ it measures, with the app's own
+Jinja environment:
+
+* compile: lexing, parsing and compiling the source (a cold worker),
+* bytecode: loading the compiled code from the bytecode cache (a worker
+  started after the cache was filled),
+
+and prints the largest templates plus the totals:
+
+    python bench/templates.py
+    python bench/templates.py --runs 10 --top 8
+
+A warmed-up worker (TEMPLATE_WARMUP) already holds every template in
+memory, so its first requests pay neither cost.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def time_loads(env, names):
+    """Seconds to load each template with an empty in-memory cache."""
+    env.cache.clear()
+    timings = {}
+    for name in names:
+        started = time.perf_counter()
+        env.get_template(name)
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=6)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="ff-templates-")
+    os.environ["FURNISHFUSION_DB"] = os.path.join(work, "bench.db")
+    os.chdir(ROOT)
+    from app import create_app
+    app = create_app({"TEMPLATE_CACHE_DIR": os.path.join(work, "jinja"), "TEMPLATE_WARMUP": False})
+    env = app.jinja_env
+    cache = env.bytecode_cache
+    names = env.list_templates()
+
+    compile_runs, bytecode_runs = [], []
+    for _ in range(args.runs):
+        cache.clear()
+        compile_runs.append(time_loads(env, names))
+        bytecode_runs.append(time_loads(env, names))
+
+    def median_ms(runs, name):
+        return statistics.median(run[name] for run in runs) * 1000
+
+    compiled = {name: median_ms(compile_runs, name) for name in names}
+    cached = {name: median_ms(bytecode_runs, name) for name in names}
+
+    print(f"{len(names)} templates, median of {args.runs} runs\n")
+    print(f"{'template':32} {'compile ms':>11} {'bytecode ms':>12}")
+    for name in sorted(names, key=lambda n: -compiled[n])[:args.top]:
+        print(f"{name:32} {compiled[name]:11.2f} {cached[name]:12.2f}")
+    total_compiled = sum(compiled.values())
+    total_cached = sum(cached.values())
+    print(f"{'all templates':32} {total_compiled:11.2f} {total_cached:12.2f}")
+    print(f"\nbytecode cache saves {total_compiled - total_cached:.1f} ms per worker "
+          f"({1 - total_cached / total_compiled:.0%}); warm-up moves the rest before the first request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Response compression for FurnishFusion.
+
+Dynamic HTML/JSON responses are gzip or brotli encoded on the way out
+(streamed responses are compressed chunk by chunk), and files under static/
+are served from precompressed ``.br`` / ``.gz`` siblings when the client
+accepts them. Run ``flask --app app precompress-static`` after a deploy to
+(re)build those siblings.
+"""
+
+import gzip
+import mimetypes
+import os
+import zlib
+
+from flask import current_app, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+# Static files worth precompressing (images are already compressed)
+PRECOMPRESS_EXTENSIONS = {".html", ".css", ".js", ".json", ".svg", ".txt"}
+
+
+def _supported_encodings():
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def _negotiate():
+    """Pick the best encoding the client accepts, or None."""
+    return request.accept_encodings.best_match(_supported_encodings())
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=current_app.config["COMPRESS_BR_QUALITY"])
+    return gzip.compress(data, compresslevel=current_app.config["COMPRESS_LEVEL"])
+
+
+def _compress_stream(chunks, encoding, level, br_quality):
+    """Compress an iterable of chunks, flushing after each so the client sees output promptly."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=br_quality)
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            out = compressor.process(chunk) + compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if out:
+                yield out
+        yield compressor.flush()
+
+
+def _add_vary(response):
+    response.vary.add("Accept-Encoding")
+
+
+def compress_response(response):
+    """after_request hook: encode compressible responses above the size threshold."""
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if "Content-Encoding" in response.headers or response.direct_passthrough:
+        return response
+
+    _add_vary(response)
+    encoding = _negotiate()
+    if not encoding:
+        return response
+
+    config = current_app.config
+    if response.is_streamed:
+        response.response = _compress_stream(
+            response.response, encoding, config["COMPRESS_LEVEL"], config["COMPRESS_BR_QUALITY"]
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESS_MIN_SIZE"]:
+            return response
+        response.set_data(_compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def serve_precompressed_static():
+    """before_request hook: answer static requests from a .br/.gz sibling when one is fresh."""
+    if request.endpoint != "static":
+        return None
+    filename = (request.view_args or {}).get("filename")
+    path = safe_join(current_app.static_folder, filename) if filename else None
+    if not path or not os.path.isfile(path):
+        return None
+
+    accepted = request.accept_encodings
+    source_mtime = os.path.getmtime(path)
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        candidate = path + suffix
+        if not accepted[encoding] or not os.path.isfile(candidate):
+            continue
+        if os.path.getmtime(candidate) < source_mtime:
+            continue  # stale sibling; fall back to the original
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        response = send_file(
+            candidate,
+            mimetype=mimetype,
+            conditional=True,
+            max_age=current_app.get_send_file_max_age(filename),
+        )
+        response.headers["Content-Encoding"] = encoding
+        _add_vary(response)
+        return response
+    return None
+
+
+def precompress_static(static_folder, min_size=500):
+    """Write .gz (and .br when available) siblings for compressible static files. Returns count written."""
+    written = 0
+    for root, _dirs, files in os.walk(static_folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in PRECOMPRESS_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) < min_size:
+                continue
+            variants = [(".gz", gzip.compress(data, compresslevel=9))]
+            if brotli is not None:
+                variants.append((".br", brotli.compress(data, quality=11)))
+            for suffix, payload in variants:
+                if len(payload) >= len(data):
+                    continue
+                with open(path + suffix, "wb") as f:
+                    f.write(payload)
+                written += 1
+    return written
+
+
+def init_compression(app):
+    """Register compression hooks and the precompress-static CLI command on the app."""
+    app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+    app.config.setdefault("COMPRESS_LEVEL", 6)
+    app.config.setdefault("COMPRESS_BR_QUALITY", 4)
+
+    app.before_request(serve_precompressed_static)
+    app.after_request(compress_response)
+
+    @app.cli.command("precompress-static")
+    def precompress_static_command():
+        """Build .gz/.br siblings for files under static/."""
+        count = precompress_static(app.static_folder, app.config["COMPRESS_MIN_SIZE"])
+        print(f"Wrote {count} precompressed file(s)")
@@ -0,0 +1,80 @@
+"""
+Versioned in-process cache for FurnishFusion's small config tables.
+
+contact_info, the UPI QR row and the active coupons are read on almost every
+dashboard/contact/checkout render but only change when an admin edits them.
+Each process keeps one snapshot of all three and reloads it when the
+``config_version`` row moves; admin write handlers bump that row in the same
+transaction as their change, so every worker picks the edit up on its next
+request.
+"""
+
+import threading
+
+from flask import g
+
+from metrics import CACHE_LOOKUPS
+
+_lock = threading.Lock()
+_snapshot = {"version": None, "contact_info": None, "upi_qr": None, "coupons": {}}
+
+
+def _normalize_code(code):
+    return (code or "").strip().upper()
+
+
+def _current_version(db):
+    row = db.execute("SELECT version FROM config_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def _load(db, version):
+    """Read all cached tables into a fresh snapshot dict."""
+    contact = db.execute("SELECT * FROM contact_info LIMIT 1").fetchone()
+    upi_qr = db.execute("SELECT * FROM upi_qr WHERE id = 1").fetchone()
+    coupons = db.execute("SELECT * FROM coupons WHERE is_active = 1").fetchall()
+    return {
+        "version": version,
+        "contact_info": dict(contact) if contact else None,
+        "upi_qr": dict(upi_qr) if upi_qr else None,
+        "coupons": {_normalize_code(c["code"]): dict(c) for c in coupons},
+    }
+
+
+def get_snapshot(db):
+    """Return the current config snapshot, reloading it if another writer bumped the version."""
+    global _snapshot
+    cached = getattr(g, "_config_snapshot", None)
+    if cached is not None:
+        return cached
+    version = _current_version(db)
+    snap = _snapshot
+    result = "hit"
+    if snap["version"] != version:
+        with _lock:
+            if _snapshot["version"] != version:
+                _snapshot = _load(db, version)
+                result = "miss"
+            snap = _snapshot
+    CACHE_LOOKUPS.inc(cache="config", result=result)
+    g._config_snapshot = snap
+    return snap
+
+
+def get_contact_info(db):
+    return get_snapshot(db)["contact_info"]
+
+
+def get_upi_qr(db):
+    return get_snapshot(db)["upi_qr"]
+
+
+def get_active_coupon(db, code):
+    """Look up an active coupon by code (case and whitespace insensitive)."""
+    return get_snapshot(db)["coupons"].get(_normalize_code(code))
+
+
+def bump_config_version(db):
+    """Mark cached config as stale; call inside the writer's transaction, before commit."""
+    db.execute("UPDATE config_version SET version = version + 1 WHERE id = 1")
+    g.pop("_config_snapshot", None)
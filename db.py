@@ -1,13 +1,17 @@
+import os
 import sqlite3
-from flask import g
+from flask import current_app, g
 
-DATABASE = 'furnishfusion.db'
+from sql_profiler import connection_factory
+
+# FURNISHFUSION_DB points the app at another file (e.g. the benchmark database)
+DATABASE = os.environ.get('FURNISHFUSION_DB', 'furnishfusion.db')
 
 def get_db():
     """Get database connection"""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
+        db = g._database = sqlite3.connect(DATABASE, factory=connection_factory(current_app))
         db.row_factory = sqlite3.Row
     return db
 
@@ -15,6 +19,11 @@ def init_db():
     """Initialize database with tables"""
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
+
+    # WAL: readers never block writers, so a page streamed to a slow client
+    # (streaming.py) does not lock checkouts and status updates out. The
+    # mode is stored in the database file.
+    cursor.execute("PRAGMA journal_mode=WAL")
     
     # Create users table
     cursor.execute('''
@@ -37,6 +46,7 @@ def init_db():
             image_url TEXT,
             category TEXT,
             rating REAL DEFAULT 0.0,
+            stock INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
@@ -51,6 +61,12 @@ def init_db():
         cursor.execute("ALTER TABLE products ADD COLUMN rating REAL DEFAULT 0.0")
     except:
         pass
+
+    # Units on hand; NULL means the product's stock is not tracked (never sells out)
+    try:
+        cursor.execute("ALTER TABLE products ADD COLUMN stock INTEGER")
+    except Exception:
+        pass
     
     # Create orders table
     cursor.execute('''
@@ -185,7 +201,74 @@ def init_db():
         cursor.execute("ALTER TABLE orders ADD COLUMN contact_address TEXT")
     except Exception:
         pass
+
+    # Key of the checkout form that placed the order; a resubmitted form finds it
+    try:
+        cursor.execute("ALTER TABLE orders ADD COLUMN idempotency_key TEXT")
+    except Exception:
+        pass
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency ON orders (user_id, idempotency_key)"
+    )
     
+    # Config version: bumped by admin writes to contact_info/upi_qr/coupons so
+    # every process knows to reload its config_cache snapshot
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO config_version (id, version) VALUES (1, 0)")
+
+    # Order listings read orders newest first and their lines by order id
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)")
+
+    # Append-only order history: live updates, status timings and the outbox (order_events.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL DEFAULT 'status',
+            order_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            from_status TEXT,
+            status TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        )
+    ''')
+    try:
+        cursor.execute("ALTER TABLE order_events ADD COLUMN kind TEXT NOT NULL DEFAULT 'status'")
+    except Exception:
+        pass
+    try:
+        cursor.execute("ALTER TABLE order_events ADD COLUMN from_status TEXT")
+    except Exception:
+        pass
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_events_user ON order_events (user_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_events_order ON order_events (order_id, id)")
+
+    # Read position of each order_events consumer (order_outbox.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_consumers (
+            name TEXT PRIMARY KEY,
+            last_event_id INTEGER NOT NULL,
+            updated_at TEXT,
+            lease_owner TEXT,
+            lease_expires REAL
+        )
+    ''')
+    try:
+        cursor.execute("ALTER TABLE event_consumers ADD COLUMN lease_owner TEXT")
+    except Exception:
+        pass
+    try:
+        cursor.execute("ALTER TABLE event_consumers ADD COLUMN lease_expires REAL")
+    except Exception:
+        pass
+
     # Create admins table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS admins (
@@ -265,6 +348,7 @@ def init_db():
 
 def close_db(e=None):
     """Close database connection"""
-    db = getattr(g, '_database', None)
+    # Pop it: a streamed response runs after this teardown and opens a new one
+    db = g.pop('_database', None)
     if db is not None:
         db.close()
@@ -0,0 +1,502 @@
+"""
+DynamoDB data access for the AWS deployment (app_aws.py).
+
+All list pages go through paginated ``query`` calls on global secondary
+indexes instead of ``scan``:
+
+    FF_Products  entity-created_at-index    every product, newest first
+                 category-created_at-index  one category, newest first
+    FF_Orders    entity-created_at-index    every order, newest first
+                 status-created_at-index    one status, newest first
+                 username-created_at-index  one customer's orders
+
+Order lines live in FF_OrderItems (order_id + line_no). An order's header
+and lines are written in a single ``TransactWriteItems`` call. With an
+idempotency key the order id is derived from the key and the header is put
+only if that id does not exist yet, so a retried checkout never creates a
+second order. Orders are read back with ``batch_get_item``.
+``DynamoStore`` implements ``repository.Repository``, the interface the
+SQLite app uses as well.
+
+``LastEvaluatedKey`` is always followed, so results are never cut off at the
+1 MB page limit, and list queries use projection expressions so only the
+attributes a page renders are read. Product items, product listings and
+user records are served from in-process TTL + LRU caches (``ttl_cache``),
+which ``create_product``/``create_user`` invalidate. boto3 is imported and
+the resource built on first use, not at import. Point ``DYNAMODB_ENDPOINT`` at DynamoDB
+Local (e.g. ``http://localhost:8000``) and run
+``flask --app app_aws create-tables`` to develop without AWS.
+"""
+
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from repository import DuplicateOrder, Repository
+from ttl_cache import TTLCache
+
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+DYNAMODB_ENDPOINT = os.environ.get("DYNAMODB_ENDPOINT")  # None -> real AWS
+
+USERS_TABLE = "FF_Users"
+ADMINS_TABLE = "FF_Admins"
+PRODUCTS_TABLE = "FF_Products"
+ORDERS_TABLE = "FF_Orders"
+ORDER_ITEMS_TABLE = "FF_OrderItems"
+
+ALL_INDEX = "entity-created_at-index"
+PRODUCTS_BY_CATEGORY_INDEX = "category-created_at-index"
+ORDERS_BY_STATUS_INDEX = "status-created_at-index"
+ORDERS_BY_USER_INDEX = "username-created_at-index"
+
+# Constant partition key for the "everything, newest first" indexes. Fine at
+# catalog scale; shard the value (PRODUCT#0..n) if write volume ever demands it.
+PRODUCT_ENTITY = "PRODUCT"
+ORDER_ENTITY = "ORDER"
+
+# Attributes the list pages render or filter on (``name`` and ``status`` are reserved words)
+PRODUCT_LIST_ATTRIBUTES = ["product_id", "name", "price", "rating", "image", "category", "created_at"]
+ORDER_LIST_ATTRIBUTES = ["order_id", "username", "product_id", "status", "total", "created_at"]
+
+
+# Read-through cache settings. Other processes converge within the TTL.
+ITEM_CACHE_TTL = 60
+LIST_CACHE_TTL = 30
+USER_CACHE_TTL = 120
+
+BATCH_GET_LIMIT = 100  # keys per BatchGetItem call
+TRANSACT_LIMIT = 100  # actions per TransactWriteItems call (header + lines)
+
+# Order ids derived from idempotency keys live in their own UUID namespace
+ORDER_ID_NAMESPACE = uuid.UUID("6f1d3c52-4a0e-4f0b-9a3c-2f6d7e8b9c10")
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _to_dynamo(value):
+    """boto3 rejects floats; store numbers as Decimal."""
+    if isinstance(value, float):
+        return Decimal(str(value))
+    return value
+
+
+def _item(item):
+    """Dict ready for the resource's client, which does the attribute-value encoding."""
+    return {k: _to_dynamo(v) for k, v in item.items()}
+
+
+def _key(name):
+    from boto3.dynamodb.conditions import Key
+    return Key(name)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _projection(attributes):
+    """Build ProjectionExpression/ExpressionAttributeNames that are safe for reserved words."""
+    names = {f"#a{i}": attr for i, attr in enumerate(attributes)}
+    return {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
+
+
+def _gsi(name, partition_key, sort_key="created_at", include=None):
+    projection = {"ProjectionType": "ALL"}
+    if include is not None:
+        projection = {"ProjectionType": "INCLUDE", "NonKeyAttributes": include}
+    return {
+        "IndexName": name,
+        "KeySchema": [
+            {"AttributeName": partition_key, "KeyType": "HASH"},
+            {"AttributeName": sort_key, "KeyType": "RANGE"},
+        ],
+        "Projection": projection,
+    }
+
+
+def _list_only(attributes, *keys):
+    return [a for a in attributes if a not in keys]
+
+
+TABLE_DEFINITIONS = [
+    {
+        "TableName": USERS_TABLE,
+        "KeySchema": [{"AttributeName": "username", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": "username", "AttributeType": "S"}],
+    },
+    {
+        "TableName": ADMINS_TABLE,
+        "KeySchema": [{"AttributeName": "username", "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": "username", "AttributeType": "S"}],
+    },
+    {
+        "TableName": PRODUCTS_TABLE,
+        "KeySchema": [{"AttributeName": "product_id", "KeyType": "HASH"}],
+        "AttributeDefinitions": [
+            {"AttributeName": "product_id", "AttributeType": "S"},
+            {"AttributeName": "entity", "AttributeType": "S"},
+            {"AttributeName": "category", "AttributeType": "S"},
+            {"AttributeName": "created_at", "AttributeType": "S"},
+        ],
+        "GlobalSecondaryIndexes": [
+            _gsi(ALL_INDEX, "entity", include=_list_only(PRODUCT_LIST_ATTRIBUTES, "product_id", "created_at")),
+            _gsi(PRODUCTS_BY_CATEGORY_INDEX, "category",
+                 include=_list_only(PRODUCT_LIST_ATTRIBUTES, "product_id", "category", "created_at")),
+        ],
+    },
+    {
+        "TableName": ORDERS_TABLE,
+        "KeySchema": [{"AttributeName": "order_id", "KeyType": "HASH"}],
+        "AttributeDefinitions": [
+            {"AttributeName": "order_id", "AttributeType": "S"},
+            {"AttributeName": "entity", "AttributeType": "S"},
+            {"AttributeName": "status", "AttributeType": "S"},
+            {"AttributeName": "username", "AttributeType": "S"},
+            {"AttributeName": "created_at", "AttributeType": "S"},
+        ],
+        "GlobalSecondaryIndexes": [
+            _gsi(ALL_INDEX, "entity", include=_list_only(ORDER_LIST_ATTRIBUTES, "order_id", "created_at")),
+            _gsi(ORDERS_BY_STATUS_INDEX, "status",
+                 include=_list_only(ORDER_LIST_ATTRIBUTES, "order_id", "status", "created_at")),
+            _gsi(ORDERS_BY_USER_INDEX, "username"),
+        ],
+    },
+    {
+        "TableName": ORDER_ITEMS_TABLE,
+        "KeySchema": [
+            {"AttributeName": "order_id", "KeyType": "HASH"},
+            {"AttributeName": "line_no", "KeyType": "RANGE"},
+        ],
+        "AttributeDefinitions": [
+            {"AttributeName": "order_id", "AttributeType": "S"},
+            {"AttributeName": "line_no", "AttributeType": "N"},
+        ],
+    },
+]
+
+
+class DynamoStore(Repository):
+    """Query-based access to the FurnishFusion DynamoDB tables."""
+
+    def __init__(self, resource=None):
+        self._resource = resource
+        self._resource_lock = threading.Lock()
+        self._tables = {}
+
+        self.product_cache = TTLCache(maxsize=2048, ttl=ITEM_CACHE_TTL, name="dynamo_products")
+        self.product_list_cache = TTLCache(maxsize=64, ttl=LIST_CACHE_TTL, name="dynamo_product_lists")
+        self.user_cache = TTLCache(maxsize=4096, ttl=USER_CACHE_TTL, name="dynamo_users")
+
+    # -------------------------------------------------
+    # Lazily built boto3 resource and tables
+    # -------------------------------------------------
+    @property
+    def resource(self):
+        if self._resource is None:
+            with self._resource_lock:
+                if self._resource is None:
+                    import boto3
+                    self._resource = boto3.resource(
+                        "dynamodb", region_name=AWS_REGION, endpoint_url=DYNAMODB_ENDPOINT
+                    )
+        return self._resource
+
+    def _table(self, name):
+        table = self._tables.get(name)
+        if table is None:
+            table = self._tables[name] = self.resource.Table(name)
+        return table
+
+    @property
+    def users(self):
+        return self._table(USERS_TABLE)
+
+    @property
+    def admins(self):
+        return self._table(ADMINS_TABLE)
+
+    @property
+    def products(self):
+        return self._table(PRODUCTS_TABLE)
+
+    @property
+    def orders(self):
+        return self._table(ORDERS_TABLE)
+
+    @property
+    def order_items(self):
+        return self._table(ORDER_ITEMS_TABLE)
+
+    def cache_stats(self):
+        return [c.stats() for c in (self.product_cache, self.product_list_cache, self.user_cache)]
+
+    # -------------------------------------------------
+    # Query helpers
+    # -------------------------------------------------
+    def query_page(self, table, index, key_condition, attributes=None, limit=50, start_key=None, newest_first=True):
+        """One page of an index query. Returns (items, next_start_key)."""
+        kwargs = {
+            "IndexName": index,
+            "KeyConditionExpression": key_condition,
+            "ScanIndexForward": not newest_first,
+            "Limit": limit,
+        }
+        if attributes:
+            kwargs.update(_projection(attributes))
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        response = table.query(**kwargs)
+        return response.get("Items", []), response.get("LastEvaluatedKey")
+
+    def query_all(self, table, index, key_condition, attributes=None, limit=None, newest_first=True):
+        """Follow LastEvaluatedKey until the index is exhausted or ``limit`` items are read."""
+        items = []
+        start_key = None
+        while True:
+            page_size = min(limit - len(items), 1000) if limit else 1000
+            page, start_key = self.query_page(
+                table, index, key_condition, attributes, page_size, start_key, newest_first
+            )
+            items.extend(page)
+            if not start_key or (limit and len(items) >= limit):
+                return items
+
+    def batch_get(self, table_name, keys, attributes=None):
+        """BatchGetItem in chunks of 100, retrying UnprocessedKeys with backoff."""
+        items = []
+        for i in range(0, len(keys), BATCH_GET_LIMIT):
+            request = {"Keys": keys[i:i + BATCH_GET_LIMIT]}
+            if attributes:
+                request.update(_projection(attributes))
+            pending = {table_name: request}
+            attempt = 0
+            while pending:
+                response = self.resource.batch_get_item(RequestItems=pending)
+                items.extend(response.get("Responses", {}).get(table_name, []))
+                pending = response.get("UnprocessedKeys") or {}
+                if pending:
+                    time.sleep(min(0.05 * (2 ** attempt), 1.0))
+                    attempt += 1
+        return items
+
+    # -------------------------------------------------
+    # Users / admins
+    # -------------------------------------------------
+    def get_user(self, username):
+        return self.user_cache.get_or_load(
+            username, lambda: self.users.get_item(Key={"username": username}).get("Item")
+        )
+
+    def find_user_for_login(self, login):
+        return self.get_user(login)
+
+    def create_user(self, fields):
+        self.users.put_item(Item=fields)
+        self.user_cache.delete(fields["username"])
+        return fields["username"]
+
+    def get_admin(self, username):
+        return self.admins.get_item(Key={"username": username}).get("Item")
+
+    # -------------------------------------------------
+    # Products
+    # -------------------------------------------------
+    def list_products(self, category=None, limit=None, min_price=None, max_price=None,
+                      min_rating=None, sort=None):
+        """Product list (cached); callers must treat the returned items as read-only."""
+        products = self.product_list_cache.get_or_load(
+            (category, limit), lambda: self._query_products(category, limit)
+        )
+        # The catalog is small, so price/rating filters and sorting run on the cached list
+        if min_price is not None:
+            products = [p for p in products if _number(p.get("price")) >= min_price]
+        if max_price is not None:
+            products = [p for p in products if _number(p.get("price")) <= max_price]
+        if min_rating is not None:
+            products = [p for p in products if _number(p.get("rating")) >= min_rating]
+        if sort == "price_asc":
+            products = sorted(products, key=lambda p: _number(p.get("price")))
+        elif sort == "price_desc":
+            products = sorted(products, key=lambda p: _number(p.get("price")), reverse=True)
+        elif sort == "rating_desc":
+            products = sorted(products, key=lambda p: _number(p.get("rating")), reverse=True)
+        return products
+
+    def _query_products(self, category, limit):
+        if category:
+            return self.query_all(self.products, PRODUCTS_BY_CATEGORY_INDEX,
+                                  _key("category").eq(category), PRODUCT_LIST_ATTRIBUTES, limit)
+        return self.query_all(self.products, ALL_INDEX,
+                              _key("entity").eq(PRODUCT_ENTITY), PRODUCT_LIST_ATTRIBUTES, limit)
+
+    def get_product(self, product_id):
+        return self.product_cache.get_or_load(
+            product_id, lambda: self.products.get_item(Key={"product_id": product_id}).get("Item")
+        )
+
+    def batch_get_products(self, product_ids):
+        products = {}
+        missing = []
+        for product_id in set(product_ids):
+            cached = self.product_cache.get(product_id)
+            if cached is not None:
+                products[product_id] = cached
+            else:
+                missing.append(product_id)
+        keys = [{"product_id": product_id} for product_id in missing]
+        for item in self.batch_get(PRODUCTS_TABLE, keys):
+            self.product_cache.set(item["product_id"], item)
+            products[item["product_id"]] = item
+        return products
+
+    def create_product(self, fields):
+        item = {"entity": PRODUCT_ENTITY, "created_at": _now(), **fields}
+        item = {k: _to_dynamo(v) for k, v in item.items()}
+        self.products.put_item(Item=item)
+        self.product_cache.delete(item["product_id"])
+        self.product_list_cache.clear()
+        return item["product_id"]
+
+    # -------------------------------------------------
+    # Orders
+    # -------------------------------------------------
+    def list_orders(self, status=None, limit=None):
+        if status:
+            return self.query_all(self.orders, ORDERS_BY_STATUS_INDEX,
+                                  _key("status").eq(status), ORDER_LIST_ATTRIBUTES, limit)
+        return self.query_all(self.orders, ALL_INDEX,
+                              _key("entity").eq(ORDER_ENTITY), ORDER_LIST_ATTRIBUTES, limit)
+
+    def list_user_orders(self, user_id, limit=None):
+        return self.query_all(self.orders, ORDERS_BY_USER_INDEX, _key("username").eq(user_id), limit=limit)
+
+    # Stock is not tracked on DynamoDB: products never run out (like NULL stock on SQLite)
+    def reserve_stock(self, lines):
+        return []
+
+    def release_stock(self, order_ids):
+        pass
+
+    @staticmethod
+    def _order_id_for_key(username, idempotency_key):
+        return str(uuid.uuid5(ORDER_ID_NAMESPACE, f"{username}:{idempotency_key}"))
+
+    def find_order_by_idempotency_key(self, user_id, idempotency_key):
+        return self.orders.get_item(
+            Key={"order_id": self._order_id_for_key(user_id, idempotency_key)}, ConsistentRead=True
+        ).get("Item")
+
+    def create_order(self, header, lines, idempotency_key=None):
+        """
+        Write the order header and every line in one TransactWriteItems round trip.
+
+        With an ``idempotency_key`` the order id is derived from it, so a retried
+        request maps to the same order. Its header's attribute_not_exists
+        condition then fails and ``DuplicateOrder`` is raised.
+        """
+        if len(lines) + 1 > TRANSACT_LIMIT:
+            raise ValueError(f"An order can have at most {TRANSACT_LIMIT - 1} lines")
+        if idempotency_key:
+            order_id = self._order_id_for_key(header.get("username"), idempotency_key)
+        else:
+            order_id = str(uuid.uuid4())
+        order = {
+            "order_id": order_id,
+            "entity": ORDER_ENTITY,
+            "created_at": _now(),
+            **header,
+            "line_count": len(lines),
+        }
+        actions = [{
+            "Put": {
+                "TableName": ORDERS_TABLE,
+                "Item": _item(order),
+                "ConditionExpression": "attribute_not_exists(order_id)",
+            }
+        }]
+        for line_no, line in enumerate(lines, start=1):
+            actions.append({
+                "Put": {
+                    "TableName": ORDER_ITEMS_TABLE,
+                    "Item": _item({"order_id": order_id, "line_no": line_no, **line}),
+                }
+            })
+        from botocore.exceptions import ClientError
+        try:
+            self.resource.meta.client.transact_write_items(TransactItems=actions)
+        except ClientError as e:
+            if idempotency_key and self._order_exists_after(e, order_id):
+                raise DuplicateOrder(order_id) from e
+            raise
+        return order_id
+
+    def _order_exists_after(self, error, order_id):
+        """Whether a failed create_order failed because ``order_id`` is already written."""
+        reasons = error.response.get("CancellationReasons") or []
+        header_reason = reasons[0].get("Code") if reasons else None  # the header is the first action
+        if header_reason == "ConditionalCheckFailed":
+            return True
+        if header_reason == "TransactionConflict":
+            # A concurrent submit of the same form is writing it; it exists if that one won
+            return self.orders.get_item(Key={"order_id": order_id}, ConsistentRead=True).get("Item") is not None
+        return False
+
+    def batch_get_order_items(self, order_ids):
+        order_ids = list(order_ids)
+        items = {order_id: [] for order_id in order_ids}
+        headers = self.batch_get(
+            ORDERS_TABLE, [{"order_id": order_id} for order_id in order_ids], ["order_id", "line_count"]
+        )
+        keys = [
+            {"order_id": h["order_id"], "line_no": line_no}
+            for h in headers
+            for line_no in range(1, int(h.get("line_count", 0)) + 1)
+        ]
+        for line in sorted(self.batch_get(ORDER_ITEMS_TABLE, keys), key=lambda l: l["line_no"]):
+            items[line["order_id"]].append(line)
+        return items
+
+    # -------------------------------------------------
+    # Setup / migration
+    # -------------------------------------------------
+    def backfill_index_attributes(self):
+        """One-off scan that adds ``entity``/``created_at`` to items written before the indexes existed."""
+        updated = 0
+        for table, entity in ((self.products, PRODUCT_ENTITY), (self.orders, ORDER_ENTITY)):
+            key_name = table.key_schema[0]["AttributeName"]
+            kwargs = {"FilterExpression": "attribute_not_exists(entity) OR attribute_not_exists(created_at)"}
+            while True:
+                response = table.scan(**kwargs)
+                for item in response.get("Items", []):
+                    table.update_item(
+                        Key={key_name: item[key_name]},
+                        UpdateExpression="SET entity = :e, created_at = if_not_exists(created_at, :t)",
+                        ExpressionAttributeValues={":e": entity, ":t": _now()},
+                    )
+                    updated += 1
+                if "LastEvaluatedKey" not in response:
+                    break
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return updated
+
+    def create_tables(self):
+        """Create any missing tables (on-demand billing). Returns the names created."""
+        existing = {t.name for t in self.resource.tables.all()}
+        created = []
+        for definition in TABLE_DEFINITIONS:
+            if definition["TableName"] in existing:
+                continue
+            table = self.resource.create_table(BillingMode="PAY_PER_REQUEST", **definition)
+            table.wait_until_exists()
+            created.append(definition["TableName"])
+        return created
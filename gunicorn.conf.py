@@ -0,0 +1,93 @@
+"""
+Gunicorn settings for running FurnishFusion in production.
+
+    gunicorn -c gunicorn.conf.py                       # app.py (SQLite)
+    FF_WSGI_APP=app_aws:app gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master (``preload_app``), so ``init_db``
+and the module imports run before fork and workers share those pages
+copy-on-write. The worker count and thread count follow the CPUs this
+process may use. Override them with WEB_CONCURRENCY and GUNICORN_THREADS.
+
+Reloading:
+- ``kill -HUP <master>`` replaces the workers gracefully. With
+  preload_app they keep the code the master loaded.
+- To deploy new code, send USR2 (start a new master next to the old one)
+  and then QUIT to the old master once the new one is serving.
+- Workers also recycle themselves after ``max_requests`` (with jitter)
+  to cap slow memory growth.
+"""
+
+import os
+import sys
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))  # respects container CPU limits
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+_cpus = _cpu_count()
+
+wsgi_app = os.environ.get("FF_WSGI_APP", "app:app")
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+preload_app = True
+
+# Requests mostly wait on SQLite/DynamoDB/S3 (or an open event stream), so each process also runs threads
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", min(2 * _cpus + 1, 12)))
+# Each open order-events stream (SSE) holds a thread; at most half of them (order_events.py)
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+os.environ["SERVER_THREADS"] = str(threads)  # read by the app, which is imported after this file
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Metrics snapshots from a previous run would otherwise be added to this one
+    if os.environ.get("METRICS_DIR"):
+        import metrics
+        metrics.clear_directory(os.environ["METRICS_DIR"])
+
+
+def child_exit(server, worker):
+    if os.environ.get("METRICS_DIR"):
+        import metrics
+        metrics.mark_process_dead(os.environ["METRICS_DIR"], worker.pid)
+
+
+def _notifier():
+    module = sys.modules.get("app_aws")
+    return getattr(module, "notifier", None)
+
+
+def _order_outbox():
+    app = getattr(sys.modules.get("app"), "app", None)
+    return app.extensions.get("order_outbox") if app is not None else None
+
+
+def post_fork(server, worker):
+    # Threads started in the master do not exist in the worker
+    notifier = _notifier()
+    if notifier is not None:
+        notifier.after_fork()
+
+
+def worker_exit(server, worker):
+    # Publish what is still queued before the worker goes away
+    notifier = _notifier()
+    if notifier is not None:
+        notifier.stop(timeout=graceful_timeout / 2)
+    outbox = _order_outbox()
+    if outbox is not None:
+        outbox.stop(timeout=graceful_timeout / 2)
@@ -0,0 +1,200 @@
+"""
+Image processing pipeline for FurnishFusion product uploads.
+
+Uploaded images live in the content-addressed upload store, which strips
+their EXIF/XMP metadata (``strip_metadata``) before naming them. A small
+background worker pool writes metadata-free WebP variants at a few widths
+next to them (``<hash>_640w.webp``). Templates use ``image_srcset`` so the
+catalog grid downloads a thumbnail instead of the full-size original. The
+widths each image has are cached per process, so rendering a page does not
+stat the variant files.
+Pillow is optional: without it uploads are stored as-is and no variants
+are generated. It is imported on the first upload or variant job rather
+than at startup, since most processes never decode an image.
+"""
+
+import importlib.util
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from ttl_cache import TTLCache
+
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Variant settings
+# ---------------------------------------------------------------------------
+VARIANT_WIDTHS = (320, 640, 1024, 1600)  # 1600 is the cap; larger originals are never served to the grid
+WEBP_QUALITY = 80
+MAX_IMAGE_PIXELS = 40_000_000  # refuse to decode anything bigger (decompression bombs)
+UPLOAD_URL_PREFIX = "/static/uploads/"
+# Variants of a content-addressed image never change; the TTL only bounds how
+# long variants written by another process (or the backfill command) go unseen
+SRCSET_CACHE_TTL = 300
+# GIFs carry no EXIF, and re-saving one would drop all but its first frame
+STRIP_FORMATS = {"JPEG", "PNG", "WEBP"}
+ORIENTATION_TAG = 0x0112
+_VARIANT_RE = re.compile(r"^(?P<stem>.+)_\d+w\.webp$")
+
+_executor = None
+_executor_lock = threading.Lock()
+_srcset_cache = TTLCache(maxsize=4096, ttl=SRCSET_CACHE_TTL, name="image_srcset")
+
+
+def variant_name(stem, width):
+    return f"{stem}_{width}w.webp"
+
+
+def is_variant(filename):
+    return _VARIANT_RE.match(filename) is not None
+
+
+def variant_stem(filename):
+    """Stem of the original image a variant filename was generated from."""
+    return _VARIANT_RE.match(filename).group("stem")
+
+
+def _pillow():
+    from PIL import Image, ImageOps
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image, ImageOps
+
+
+def _has_metadata(im):
+    return (
+        bool(im.getexif())
+        or any(key in im.info for key in ("xmp", "XML:com.adobe.xmp", "comment"))
+        or bool(getattr(im, "text", None))  # PNG text chunks
+    )
+
+
+def strip_metadata(path):
+    """Rewrite the image at ``path`` without its EXIF/XMP/text metadata; returns whether it was rewritten.
+
+    The orientation tag goes with the EXIF data, so the pixels are turned
+    upright first. A JPEG that needs no turning keeps its quantization tables.
+    """
+    if not PILLOW_AVAILABLE:
+        return False
+    Image, ImageOps = _pillow()
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with Image.open(path) as im:
+            if im.format not in STRIP_FORMATS or not _has_metadata(im):
+                return False
+            options = {"icc_profile": im.info["icc_profile"]} if "icc_profile" in im.info else {}
+            upright = im if im.getexif().get(ORIENTATION_TAG, 1) == 1 else ImageOps.exif_transpose(im)
+            if im.format == "JPEG" and upright is im:
+                options.update(quality="keep", subsampling="keep", optimize=True)
+            elif im.format == "JPEG":
+                options.update(quality=95, optimize=True)
+            elif im.format == "WEBP":
+                options.update(quality=90)
+            upright.save(tmp, im.format, **options)
+        os.replace(tmp, path)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def generate_variants(path):
+    """Write WebP variants of the image at ``path``; returns the widths written."""
+    if not PILLOW_AVAILABLE:
+        return []
+    Image, ImageOps = _pillow()
+    folder = os.path.dirname(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    written, present = [], []
+    with Image.open(path) as original:
+        im = ImageOps.exif_transpose(original)
+        im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+        for width in VARIANT_WIDTHS:
+            if width > im.width:
+                break  # never upscale
+            out = os.path.join(folder, variant_name(stem, width))
+            present.append(width)
+            if os.path.exists(out):
+                continue
+            height = max(1, round(im.height * width / im.width))
+            resized = im.resize((width, height), Image.LANCZOS)
+            # Saving without exif/icc_profile drops the original's metadata
+            tmp = f"{out}.{threading.get_ident()}.tmp"
+            try:
+                resized.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+                os.replace(tmp, out)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            written.append(width)
+    _srcset_cache.set((folder, stem), _srcset(stem, present))
+    return written
+
+
+def _run_variants(path):
+    try:
+        generate_variants(path)
+    except Exception:
+        log.exception("Could not generate image variants for %s", path)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get("IMAGE_VARIANT_WORKERS", 2),
+                    thread_name_prefix="image-variants",
+                )
+    return _executor
+
+
+def schedule_variants(path):
+    """Queue variant generation for ``path`` without blocking the request."""
+    if not PILLOW_AVAILABLE:
+        return None
+    return _get_executor().submit(_run_variants, path)
+
+
+def _srcset(stem, widths):
+    return ", ".join(f"{UPLOAD_URL_PREFIX}{variant_name(stem, width)} {width}w" for width in widths)
+
+
+def _existing_widths(folder, stem):
+    return [width for width in VARIANT_WIDTHS if os.path.exists(os.path.join(folder, variant_name(stem, width)))]
+
+
+def image_srcset(url):
+    """Template helper: srcset string for an uploaded image's WebP variants ('' if none)."""
+    if not url or not url.startswith(UPLOAD_URL_PREFIX):
+        return ""
+    folder = current_app.config["UPLOAD_FOLDER"]
+    stem = os.path.splitext(url[len(UPLOAD_URL_PREFIX):])[0]
+    return _srcset_cache.get_or_load((folder, stem), lambda: _srcset(stem, _existing_widths(folder, stem)))
+
+
+def init_image_pipeline(app):
+    """Register the srcset template helper and the variant backfill CLI command."""
+    app.add_template_global(image_srcset)
+
+    @app.cli.command("build-image-variants")
+    def build_image_variants_command():
+        """Generate WebP variants for every image already in the upload folder."""
+        folder = app.config["UPLOAD_FOLDER"]
+        count = 0
+        for name in sorted(os.listdir(folder)):
+            if is_variant(name) or name.startswith("."):
+                continue
+            try:
+                count += len(generate_variants(os.path.join(folder, name)))
+            except Exception as e:
+                print(f"Skipping {name}: {e}")
+        print(f"Wrote {count} variant(s)")
@@ -0,0 +1,406 @@
+"""
+Runtime metrics for FurnishFusion, served on ``/metrics`` in the Prometheus
+text format.
+
+Request hooks record, per blueprint and endpoint:
+
+    furnishfusion_http_requests_total            method, status
+    furnishfusion_http_request_duration_seconds  latency histogram
+    furnishfusion_http_requests_in_flight        gauge
+    furnishfusion_sql_queries_total / furnishfusion_sql_seconds_total
+                                                 from sql_profiler's per-request stats
+
+config_cache, ttl_cache and upload_store add cache lookups (hit/miss, so
+the hit ratio is ``rate(..{result="hit"}) / rate(..)``) and upload
+counts and bytes.
+
+Updates are cheap. Every thread writes only to its own shard, a plain
+dict, so no lock is taken on the request path. A scrape sums the shards.
+When a thread exits its shard is folded into the metric's base totals,
+so threads that come and go (gthread, the ASGI pool) do not pile up
+shards.
+
+Under gunicorn every worker has its own shards. Set ``METRICS_DIR`` to a
+directory the workers share. Each process then writes its totals to
+``<pid>.json`` there every ``METRICS_FLUSH_SECONDS`` (and on exit), and
+``/metrics`` merges every file. Counters and histograms of exited
+workers keep counting: gunicorn's ``child_exit`` folds each one into
+``dead.json``. Gauges only count live processes.
+"""
+
+import atexit
+import bisect
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+import weakref
+
+from flask import Response, current_app, g, request
+
+from sql_profiler import request_profile
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_FLUSH_SECONDS = 5.0
+DEAD_FILE = "dead.json"
+
+REGISTRY = []
+
+
+# -------------------------------------------------
+# Metric types
+# -------------------------------------------------
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._base = {}  # totals of exited threads
+        self._shards = []
+        self._shards_lock = threading.Lock()  # not taken by updates after a thread's first
+        REGISTRY.append(self)
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            # The thread-local drops the owner when the thread exits, which folds the shard
+            self._local.owner = owner = _ShardOwner()
+            weakref.finalize(owner, self._retire, values)
+            with self._shards_lock:
+                self._shards.append(values)
+            return values
+
+    def _retire(self, values):
+        with self._shards_lock:
+            self._merge(self._base, values)
+            # By identity: another thread's shard may hold equal counts
+            self._shards = [shard for shard in self._shards if shard is not values]
+
+    @staticmethod
+    def _merge(totals, samples):
+        for key, value in samples.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _add(self, key, amount):
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def collect(self):
+        """{label values: value} summed over all threads."""
+        with self._shards_lock:
+            totals = {}
+            self._merge(totals, self._base)
+            for shard in self._shards:
+                self._merge(totals, shard.copy())
+        return totals
+
+
+class _ShardOwner:
+    """Lives in a thread's local storage only; its finalizer retires that thread's shard."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self._add(self._key(labels), amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        self._add(self._key(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        self._add(self._key(labels), -amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        counts = shard.get(key)
+        if counts is None:
+            # one slot per bucket, +Inf, then sum
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @staticmethod
+    def _merge(totals, samples):
+        for key, counts in samples.items():
+            merged = totals.get(key)
+            totals[key] = list(counts) if merged is None else [a + b for a, b in zip(merged, counts)]
+
+
+# -------------------------------------------------
+# Application metrics
+# -------------------------------------------------
+HTTP_REQUESTS = Counter(
+    "furnishfusion_http_requests_total", "HTTP requests handled.",
+    ("blueprint", "endpoint", "method", "status"),
+)
+HTTP_LATENCY = Histogram(
+    "furnishfusion_http_request_duration_seconds", "Time spent handling a request.",
+    ("blueprint", "endpoint"),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "furnishfusion_http_requests_in_flight", "Requests being handled right now.", ("blueprint",),
+)
+SQL_QUERIES = Counter(
+    "furnishfusion_sql_queries_total", "SQLite statements executed by requests.", ("blueprint",),
+)
+SQL_SECONDS = Counter(
+    "furnishfusion_sql_seconds_total", "Time requests spent in SQLite (execute + fetch).", ("blueprint",),
+)
+CACHE_LOOKUPS = Counter(
+    "furnishfusion_cache_lookups_total", "In-process cache lookups.", ("cache", "result"),
+)
+UPLOADS = Counter(
+    "furnishfusion_uploads_total", "Uploaded files by outcome.", ("result",),
+)
+UPLOAD_BYTES = Counter(
+    "furnishfusion_upload_bytes_total", "Bytes of uploaded files stored.", ("kind",),
+)
+
+
+# -------------------------------------------------
+# Text exposition
+# -------------------------------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(families):
+    """Prometheus text format for [(metric, {label values: value})]."""
+    lines = []
+    for metric, samples in families:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(samples.items()):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_format_labels(metric.labelnames, key)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            bounds = [repr(b) for b in metric.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                labels = _format_labels(metric.labelnames, key, [("le", bound)])
+                lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(metric.labelnames, key)
+            lines.append(f"{metric.name}_sum{labels} {_format_value(value[-1])}")
+            lines.append(f"{metric.name}_count{labels} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------------------
+# Multiprocess mode (one JSON file per process in METRICS_DIR)
+# -------------------------------------------------
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def snapshot():
+    """This process's metrics as a JSON-serialisable dict."""
+    return {
+        metric.name: [[list(key), value] for key, value in metric.collect().items()]
+        for metric in REGISTRY
+    }
+
+
+def write_snapshot(directory):
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"pid": os.getpid(), "metrics": snapshot()}, f)
+    os.replace(tmp, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge_samples(metric, totals, samples):
+    for key, value in samples:
+        key = tuple(key)
+        if metric.kind == "histogram":
+            current = totals.get(key)
+            totals[key] = value if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def merge_directory(directory):
+    """Sum the snapshots of every process in ``directory``."""
+    by_name = {metric.name: metric for metric in REGISTRY}
+    merged = {metric.name: {} for metric in REGISTRY}
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced right now
+        alive = data.get("pid") is not None and _pid_alive(data["pid"])
+        for name, samples in data["metrics"].items():
+            metric = by_name.get(name)
+            if metric is None or (metric.kind == "gauge" and not alive):
+                continue
+            _merge_samples(metric, merged[name], samples)
+    return [(metric, merged[metric.name]) for metric in REGISTRY]
+
+
+def mark_process_dead(directory, pid):
+    """Fold an exited worker's counters and histograms into ``dead.json`` and drop its gauges (gunicorn child_exit).
+
+    Only the master calls this, so ``dead.json`` has a single writer.
+    """
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    aggregate = os.path.join(directory, DEAD_FILE)
+    try:
+        with open(aggregate) as f:
+            dead = json.load(f)["metrics"]
+    except (OSError, ValueError):
+        dead = {}
+    by_name = {metric.name: metric for metric in REGISTRY}
+    for name, samples in data["metrics"].items():
+        metric = by_name.get(name)
+        if metric is None or metric.kind == "gauge":
+            continue
+        totals = {tuple(key): value for key, value in dead.get(name, [])}
+        _merge_samples(metric, totals, samples)
+        dead[name] = [[list(key), value] for key, value in totals.items()]
+    tmp = f"{aggregate}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"pid": None, "metrics": dead}, f)
+    os.replace(tmp, aggregate)
+    os.remove(path)  # a new worker may reuse the pid
+
+
+def clear_directory(directory):
+    """Remove all snapshots, e.g. when the gunicorn master starts."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+
+
+def _ensure_flusher(directory, interval):
+    """Start this process's snapshot thread (once per process, so also after a fork)."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+
+        def flush_forever():
+            while True:
+                time.sleep(interval)
+                write_snapshot(directory)
+
+        threading.Thread(target=flush_forever, name="metrics-flush", daemon=True).start()
+        atexit.register(write_snapshot, directory)
+
+
+# -------------------------------------------------
+# Flask integration
+# -------------------------------------------------
+def _blueprint():
+    return request.blueprint or "app"
+
+
+def start_request_metrics():
+    directory = current_app.config["METRICS_DIR"]
+    if directory:
+        _ensure_flusher(directory, current_app.config["METRICS_FLUSH_SECONDS"])
+    if request.endpoint == "metrics":
+        return
+    g._metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(blueprint=_blueprint())
+
+
+def remember_status(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def finish_request_metrics(exc=None):
+    started = g.pop("_metrics_started", None)
+    if started is None:
+        return
+    blueprint = _blueprint()
+    endpoint = request.endpoint or "none"
+    status = g.pop("_metrics_status", 500 if exc is not None else 200)
+    HTTP_IN_FLIGHT.dec(blueprint=blueprint)
+    HTTP_REQUESTS.inc(blueprint=blueprint, endpoint=endpoint, method=request.method, status=status)
+    HTTP_LATENCY.observe(time.perf_counter() - started, blueprint=blueprint, endpoint=endpoint)
+
+    profile = request_profile()
+    if profile is not None and profile.count:
+        SQL_QUERIES.inc(profile.count, blueprint=blueprint)
+        SQL_SECONDS.inc(profile.total, blueprint=blueprint)
+
+
+def metrics_view():
+    token = current_app.config["METRICS_TOKEN"]
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    directory = current_app.config["METRICS_DIR"]
+    if directory:
+        write_snapshot(directory)
+        families = merge_directory(directory)
+    else:
+        families = [(metric, metric.collect()) for metric in REGISTRY]
+    return Response(render(families), content_type=CONTENT_TYPE)
+
+
+def init_metrics(app):
+    """Instrument requests and serve /metrics (set METRICS_TOKEN to require a bearer token)."""
+    app.config.setdefault("METRICS_DIR", os.environ.get("METRICS_DIR"))
+    app.config.setdefault("METRICS_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS)
+    app.config.setdefault("METRICS_TOKEN", os.environ.get("METRICS_TOKEN"))
+    app.before_request(start_request_metrics)
+    app.after_request(remember_status)
+    app.teardown_request(finish_request_metrics)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
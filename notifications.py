@@ -0,0 +1,231 @@
+"""
+Background notification dispatcher for FurnishFusion.
+
+Request handlers call ``dispatcher.notify(subject, message)``, which only
+puts the message on an in-process queue. Worker threads publish it later:
+messages with the same subject that arrive within ``coalesce_window``
+seconds go out as one publish, failed publishes are retried with
+exponential backoff, and a full queue drops the message (counted in
+``metrics()``) rather than blocking the request.
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+# -------------------------------------------------
+# Publishers
+# -------------------------------------------------
+class SnsPublisher:
+    """
+    Publishes to an SNS topic. Without an explicit ``client`` the boto3
+    client is built on the first publish (in a worker thread), so importing
+    boto3 and creating the client stay off the startup path.
+    """
+
+    def __init__(self, topic_arn, region_name=None, client=None):
+        self.topic_arn = topic_arn
+        self.region_name = region_name
+        self._client = client
+        self._owns_client = client is None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client("sns", region_name=self.region_name)
+        return self._client
+
+    def after_fork(self):
+        # A client built in the parent would share its connection pool with the child
+        self._client_lock = threading.Lock()
+        if self._owns_client:
+            self._client = None
+
+    def __call__(self, subject, message):
+        self.client.publish(TopicArn=self.topic_arn, Subject=subject[:100], Message=message)
+
+
+class LogPublisher:
+    """Writes notifications to the log (the default when no topic is configured)."""
+
+    def __call__(self, subject, message):
+        log.info("Notification: %s\n%s", subject, message)
+
+
+class FakePublisher:
+    """Records publishes in memory; ``fail_times`` makes the first N calls raise."""
+
+    def __init__(self, fail_times=0):
+        self.published = []
+        self.fail_times = fail_times
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, subject, message):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.fail_times:
+                raise RuntimeError("fake publish failure")
+            self.published.append((subject, message))
+
+
+# -------------------------------------------------
+# Dispatcher
+# -------------------------------------------------
+class NotificationDispatcher:
+    def __init__(self, publisher, workers=2, max_queue=1000, max_retries=3,
+                 backoff=0.5, coalesce_window=1.0, max_batch=20):
+        self.publisher = publisher
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "published": 0,
+            "coalesced": 0,
+            "retried": 0,
+            "failed": 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def start(self):
+        """Start the worker threads (call again after a fork; threads do not survive it)."""
+        self._threads = [t for t in self._threads if t.is_alive()]
+        self._stopping.clear()
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"notify-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def after_fork(self):
+        """
+        Reset and restart in a forked child. The parent's worker threads do
+        not exist here and may have held these locks at fork time, so the
+        child gets fresh ones; messages queued in the parent stay the
+        parent's to send.
+        """
+        if hasattr(self.publisher, "after_fork"):
+            self.publisher.after_fork()
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._stats_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+        return self.start()
+
+    def stop(self, timeout=5.0):
+        """Drain what is queued (up to ``timeout``) and stop the workers."""
+        deadline = time.monotonic() + timeout
+        while not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def notify(self, subject, message):
+        """Queue a notification. Returns False if it was dropped because the queue is full."""
+        try:
+            self._queue.put_nowait((subject, message))
+        except queue.Full:
+            self._count("dropped")
+            log.warning("Notification queue full, dropped: %s", subject)
+            return False
+        self._count("enqueued")
+        return True
+
+    def publish_now(self, notifications):
+        """
+        Publish ``(subject, message)`` pairs in the calling thread, coalesced
+        by subject and with the usual retries. Returns True only if every
+        publish succeeded; it stops at the first one that did not.
+        """
+        groups = {}
+        for subject, message in notifications:
+            groups.setdefault(subject, []).append(message)
+        return self._publish_groups(groups)
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["workers_alive"] = sum(t.is_alive() for t in self._threads)
+        return stats
+
+    # -------------------------------------------------
+    # Worker side
+    # -------------------------------------------------
+    def _collect_batch(self, first):
+        """Gather messages arriving within the coalesce window, grouped by subject."""
+        groups = {first[0]: [first[1]]}
+        count = 1
+        deadline = time.monotonic() + self.coalesce_window
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                subject, message = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            groups.setdefault(subject, []).append(message)
+            count += 1
+        return groups, count
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            groups, count = self._collect_batch(first)
+            try:
+                self._publish_groups(groups, stop_on_failure=False)
+            finally:
+                for _ in range(count):
+                    self._queue.task_done()
+
+    def _publish_groups(self, groups, stop_on_failure=True):
+        ok = True
+        for subject, messages in groups.items():
+            if len(messages) > 1:
+                self._count("coalesced", len(messages) - 1)
+                subject = f"{subject} ({len(messages)})"
+            if not self._publish(subject, "\n".join(messages)):
+                ok = False
+                if stop_on_failure:
+                    break
+        return ok
+
+    def _publish(self, subject, message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.publisher(subject, message)
+                self._count("published")
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self._count("failed")
+                    log.error("Notification failed after %d attempts: %s (%s)", attempt + 1, subject, e)
+                    return False
+                self._count("retried")
+                delay = self.backoff * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay / 2))
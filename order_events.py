@@ -0,0 +1,329 @@
+"""
+Live order status updates, pushed to the browser with Server-Sent Events.
+
+Every new order and status change is appended to the ``order_events``
+table, in the same transaction as the change itself.
+That table is the change log all workers share:
+
+* each process runs one ``ChangeLogTailer`` thread. It checks
+  ``PRAGMA data_version`` (which only moves when another connection
+  commits) every ``ORDER_EVENTS_POLL_SECONDS`` and, when it moved, reads
+  the new rows by primary key;
+* the tailer hands the rows to the in-process ``EventBroker``, which puts
+  them on the queue of every open stream of that order's user, and of
+  every admin stream.
+
+Events are ``placed`` (``record_order_placed``) or ``status``
+(``record_status_change``, with the ``from_status`` it left). ``GET
+/orders/events`` streams a customer's own events (routes/order_routes.py).
+``GET /admin/orders/events`` streams everyone's, and the admin pages fetch
+the changed rows from ``/admin/api/orders/since/<id>`` (``changed_orders``).
+The table is never updated, so it is also the order history:
+``status_durations`` answers how long orders stay in each status, and
+order_outbox.py sends notifications from it.
+
+A browser that reconnects sends ``Last-Event-ID`` and first gets the events it
+missed from the table. Each stream holds a server thread for as long as
+it is open. Streams therefore end after ``ORDER_EVENTS_STREAM_SECONDS``,
+when ``EventSource`` reconnects on its own, and at most
+``ORDER_EVENTS_MAX_STREAMS`` are open per process. That defaults to half
+the process's request threads (``SERVER_THREADS``, exported by
+gunicorn.conf.py and asgi.py), so streams never starve ordinary requests.
+Under gunicorn's defaults that is 8 of 16 threads per worker, and 20 of
+40 under asgi.py. Raise ``GUNICORN_THREADS`` / ``ASGI_THREADS`` for more
+open tabs; a refused stream gets a 503 and the page retries later.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import Response
+
+log = logging.getLogger(__name__)
+
+RETRY_MS = 5000
+HEARTBEAT_SECONDS = 5  # also how soon a closed connection frees its stream slot
+TAIL_BATCH = 500
+
+
+EVENT_FIELDS = ("id", "kind", "order_id", "user_id", "from_status", "status", "created_at")
+
+
+def record_status_changes(db, changes):
+    """Append ``(order_id, user_id, from_status, status)`` changes with one executemany.
+
+    Call inside the writer's transaction, before commit.
+    """
+    now = datetime.now().isoformat(timespec="seconds")
+    db.executemany(
+        """INSERT INTO order_events (kind, order_id, user_id, from_status, status, created_at)
+           VALUES ('status', ?, ?, ?, ?, ?)""",
+        [(order_id, user_id, from_status, status, now) for order_id, user_id, from_status, status in changes]
+    )
+
+
+def record_status_change(db, order_id, user_id, from_status, status):
+    """Append one status change to the change log; call inside the writer's transaction, before commit."""
+    record_status_changes(db, [(order_id, user_id, from_status, status)])
+
+
+def record_order_placed(db, order_id, user_id, status="pending"):
+    """Append a new order to the change log; call inside the writer's transaction, before commit."""
+    db.execute(
+        "INSERT INTO order_events (kind, order_id, user_id, status, created_at) VALUES ('placed', ?, ?, ?, ?)",
+        (order_id, user_id, status, datetime.now().isoformat(timespec="seconds"))
+    )
+
+
+def _event(row):
+    return {key: row[key] for key in EVENT_FIELDS}
+
+
+def events_since(db, last_id, user_id=None, limit=TAIL_BATCH):
+    """Events after ``last_id`` (for one user, or all of them), oldest first."""
+    query = "SELECT * FROM order_events WHERE id > ?"
+    params = [last_id]
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params.append(user_id)
+    query += " ORDER BY id LIMIT ?"
+    params.append(limit)
+    return [_event(row) for row in db.execute(query, params)]
+
+
+def latest_event_id(db):
+    return db.execute("SELECT COALESCE(MAX(id), 0) FROM order_events").fetchone()[0]
+
+
+def changed_orders(db, last_id, limit=TAIL_BATCH):
+    """Orders placed or changed after event ``last_id``, for the admin feed.
+
+    Returns ``(cursor, orders, placed_ids, more)``: the id of the last event
+    read, the current rows (with user name and email) of the orders those
+    events touched, the ids among them that were placed in this window, and
+    whether more events are waiting after ``cursor``.
+    """
+    events = events_since(db, last_id, limit=limit)
+    if not events:
+        return last_id, [], set(), False
+    order_ids = list(dict.fromkeys(event["order_id"] for event in events))
+    placed_ids = {event["order_id"] for event in events if event["kind"] == "placed"}
+    rows = db.execute(
+        f"""SELECT o.*, u.name AS user_name, u.email AS user_email
+           FROM orders o
+           JOIN users u ON u.id = o.user_id
+           WHERE o.id IN ({", ".join("?" for _ in order_ids)})
+           ORDER BY o.created_at DESC, o.id DESC""",
+        order_ids
+    ).fetchall()
+    return events[-1]["id"], rows, placed_ids, len(events) == limit
+
+
+def status_durations(db, since=None):
+    """How long orders stay in each status, from the event history.
+
+    A status lasts from the event that entered it to the order's next
+    event. Returns one dict per status: ``left`` (orders that moved on),
+    ``avg_seconds`` and ``max_seconds`` over those, and ``current``
+    (orders still in it). ``since`` (ISO timestamp) only counts statuses
+    entered from then on. Orders older than the event log are counted
+    from their first recorded change.
+    """
+    rows = db.execute(
+        """WITH timeline AS (
+               SELECT status, created_at,
+                      LEAD(created_at) OVER (PARTITION BY order_id ORDER BY id) AS left_at
+               FROM order_events
+           )
+           SELECT status,
+                  COUNT(left_at) AS left_count,
+                  AVG((julianday(left_at) - julianday(created_at)) * 86400) AS avg_seconds,
+                  MAX((julianday(left_at) - julianday(created_at)) * 86400) AS max_seconds,
+                  COUNT(*) - COUNT(left_at) AS current
+           FROM timeline
+           WHERE created_at >= ?
+           GROUP BY status""",
+        (since or "",)
+    ).fetchall()
+    return [
+        {
+            "status": row["status"],
+            "left": row["left_count"],
+            "avg_seconds": round(row["avg_seconds"], 1) if row["avg_seconds"] is not None else None,
+            "max_seconds": round(row["max_seconds"], 1) if row["max_seconds"] is not None else None,
+            "current": row["current"],
+        }
+        for row in rows
+    ]
+
+
+# -------------------------------------------------
+# In-process pub/sub
+# -------------------------------------------------
+class Subscription:
+    def __init__(self, user_id, last_id):
+        self.user_id = user_id
+        self.last_id = last_id
+        self.queue = queue.SimpleQueue()
+
+
+class EventBroker:
+    """Fans events out to the subscriptions of their user (``user_id=None`` receives all)."""
+
+    def __init__(self, max_subscriptions):
+        self.max_subscriptions = max_subscriptions
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # user_id -> set of Subscription
+        self._count = 0
+
+    def subscribe(self, user_id, last_id):
+        """A new Subscription, or None when the per-process limit is reached."""
+        with self._lock:
+            if self._count >= self.max_subscriptions:
+                return None
+            subscription = Subscription(user_id, last_id)
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._count -= 1
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, event):
+        with self._lock:
+            targets = list(self._subscriptions.get(event["user_id"], ()))
+            targets.extend(self._subscriptions.get(None, ()))
+        for subscription in targets:
+            subscription.queue.put(event)
+
+
+# -------------------------------------------------
+# Cross-worker fan-out
+# -------------------------------------------------
+class ChangeLogTailer:
+    """Publishes rows appended to ``order_events`` by any process to this process's broker."""
+
+    def __init__(self, database, broker, interval):
+        self.database = database
+        self.broker = broker
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self, start_id):
+        """Start the tailer thread after event ``start_id`` (once per process, so also after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, args=(start_id,), name="order-events-tailer", daemon=True).start()
+
+    def _run(self, last_id):
+        conn = sqlite3.connect(self.database)
+        conn.row_factory = sqlite3.Row
+        version = None
+        while True:
+            time.sleep(self.interval)
+            try:
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current == version:
+                    continue
+                version = current
+                while True:
+                    events = events_since(conn, last_id)
+                    for event in events:
+                        self.broker.publish(event)
+                    if events:
+                        last_id = events[-1]["id"]
+                    if len(events) < TAIL_BATCH:
+                        break
+            except sqlite3.Error as e:
+                log.warning("Reading order_events failed: %s", e)
+
+
+# -------------------------------------------------
+# SSE
+# -------------------------------------------------
+def format_event(event):
+    data = json.dumps({key: event[key] for key in EVENT_FIELDS if key != "user_id"})
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {data}\n\n"
+
+
+def _stream(hub, subscription, backlog, lifetime):
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        for event in backlog:
+            subscription.last_id = event["id"]
+            yield format_event(event)
+        deadline = time.monotonic() + lifetime
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = subscription.queue.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if event["id"] <= subscription.last_id:
+                continue  # already sent from the backlog
+            subscription.last_id = event["id"]
+            yield format_event(event)
+    finally:
+        hub.broker.unsubscribe(subscription)
+
+
+def event_stream_response(app, db, user_id, last_event_id):
+    """SSE response with ``user_id``'s events (``None``: everyone's) after ``last_event_id`` (None: from now on)."""
+    hub = app.extensions["order_events"]
+    latest = latest_event_id(db)
+    hub.tailer.ensure_running(latest)
+    last_id = last_event_id if last_event_id is not None else latest
+    # Subscribe before reading the backlog so nothing committed in between is missed
+    subscription = hub.broker.subscribe(user_id, last_id)
+    if subscription is None:
+        response = Response("too many open event streams\n", status=503, mimetype="text/plain")
+        response.headers["Retry-After"] = str(RETRY_MS // 1000)
+        return response
+    backlog = events_since(db, last_id, user_id) if last_event_id is not None else []
+    response = Response(
+        _stream(hub, subscription, backlog, app.config["ORDER_EVENTS_STREAM_SECONDS"]),
+        mimetype="text/event-stream",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx: pass events through unbuffered
+    return response
+
+
+def default_max_streams():
+    """Half the request threads of this process (the dev server has no limit, so assume 16)."""
+    return max(1, int(os.environ.get("SERVER_THREADS", 16)) // 2)
+
+
+class OrderEventsHub:
+    def __init__(self, database, max_streams, poll_seconds):
+        self.broker = EventBroker(max_streams)
+        self.tailer = ChangeLogTailer(database, self.broker, poll_seconds)
+
+
+def init_order_events(app, database):
+    app.config.setdefault("ORDER_EVENTS_POLL_SECONDS", 1.0)
+    app.config.setdefault("ORDER_EVENTS_STREAM_SECONDS", 300)
+    app.config.setdefault("ORDER_EVENTS_MAX_STREAMS", int(os.environ.get("ORDER_EVENTS_MAX_STREAMS", default_max_streams())))
+    app.extensions["order_events"] = OrderEventsHub(
+        database, app.config["ORDER_EVENTS_MAX_STREAMS"], app.config["ORDER_EVENTS_POLL_SECONDS"]
+    )
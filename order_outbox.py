@@ -0,0 +1,221 @@
+"""
+Order notifications sent from the ``order_events`` table (a transactional
+outbox).
+
+The event row is written in the same transaction as the order change
+(order_events.py), so a notification exists exactly when the change was
+committed. Requests never wait for a publisher, and a publish that fails
+or a worker that restarts does not lose the change.
+
+* Each process runs one ``OrderOutbox`` thread, started by its first
+  request (so after gunicorn forks). It wakes every
+  ``ORDER_OUTBOX_POLL_SECONDS`` and reads only when ``PRAGMA
+  data_version`` moved.
+* The consumer's position is the ``event_consumers`` row named
+  ``ORDER_OUTBOX_CONSUMER``. Under ``BEGIN IMMEDIATE`` a worker reads the
+  events after it and takes the row's lease for
+  ``ORDER_OUTBOX_LEASE_SECONDS``, so other workers leave those events
+  alone. It publishes them outside the transaction (coalesced by subject,
+  with the ``NotificationDispatcher``'s retries, notifications.py) and
+  only then moves the position past them and drops the lease.
+* A batch that fails is published again on the next poll. A worker that
+  dies mid-batch leaves its lease to expire and another worker sends the
+  batch. Delivery is therefore at least once: a batch may be sent twice,
+  never skipped.
+
+``ORDER_OUTBOX_PUBLISHER`` is any ``publisher(subject, message)``. The
+default is an ``SnsPublisher`` when ``SNS_TOPIC_ARN`` is set, else a
+``LogPublisher``. ``ORDER_OUTBOX = False`` turns the consumer off.
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from notifications import LogPublisher, NotificationDispatcher, SnsPublisher
+from order_events import events_since, latest_event_id
+
+log = logging.getLogger(__name__)
+
+CONSUMER = "notifications"
+LEASE_SECONDS = 60
+
+
+def notification(event):
+    """(subject, message) for an order event."""
+    if event["kind"] == "placed":
+        return "New Order", f"Order {event['order_id']} placed by user {event['user_id']}"
+    return "Order Status", f"Order {event['order_id']}: {event['from_status'] or 'unknown'} -> {event['status']}"
+
+
+def register_consumer(db, name):
+    """Create the position of consumer ``name`` at the newest event, unless it exists (earlier events are not sent)."""
+    db.execute(
+        "INSERT OR IGNORE INTO event_consumers (name, last_event_id, updated_at) VALUES (?, ?, ?)",
+        (name, latest_event_id(db), datetime.now().isoformat(timespec="seconds"))
+    )
+
+
+class OrderOutbox:
+    """Publishes committed order events through a NotificationDispatcher, leasing each batch to one worker."""
+
+    def __init__(self, database, dispatcher, interval, name=CONSUMER, lease_seconds=LEASE_SECONDS):
+        self.database = database
+        self.dispatcher = dispatcher
+        self.interval = interval
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.batch = dispatcher.max_batch
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def owner(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_running(self):
+        """Start the consumer thread (once per process, so also after a fork)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None and hasattr(self.dispatcher.publisher, "after_fork"):
+                self.dispatcher.publisher.after_fork()
+            self._pid = os.getpid()
+            self._stopping = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="order-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the consumer thread after the batch it is publishing (up to ``timeout``)."""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def claim(self, conn):
+        """Lease the next batch of events after this consumer's position.
+
+        Returns the events (empty when there are none), or None while
+        another worker's lease on the consumer has not expired.
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT last_event_id, lease_owner, lease_expires FROM event_consumers WHERE name = ?", (self.name,)
+            ).fetchone()
+            if row is None:
+                register_consumer(conn, self.name)
+                conn.commit()
+                return []
+            if row["lease_owner"] not in (None, self.owner) and row["lease_expires"] > now:
+                conn.commit()
+                return None
+            events = events_since(conn, row["last_event_id"], limit=self.batch)
+            if events:
+                conn.execute(
+                    "UPDATE event_consumers SET lease_owner = ?, lease_expires = ? WHERE name = ?",
+                    (self.owner, now + self.lease_seconds, self.name)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return events
+
+    def ack(self, conn, events):
+        """Move the position past published ``events`` and drop the lease. False if the lease was lost meanwhile."""
+        cursor = conn.execute(
+            """UPDATE event_consumers
+               SET last_event_id = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+               WHERE name = ? AND lease_owner = ?""",
+            (events[-1]["id"], datetime.now().isoformat(timespec="seconds"), self.name, self.owner)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+    def release(self, conn):
+        """Drop the lease without moving the position, so the batch is claimed again."""
+        conn.execute(
+            "UPDATE event_consumers SET lease_owner = NULL, lease_expires = NULL WHERE name = ? AND lease_owner = ?",
+            (self.name, self.owner)
+        )
+        conn.commit()
+
+    def publish_pending(self, conn):
+        """Publish batches until none is left. False if a batch failed or another worker holds the lease."""
+        while True:
+            events = self.claim(conn)
+            if events is None:
+                return False
+            if not events:
+                return True
+            if not self.dispatcher.publish_now([notification(event) for event in events]):
+                self.release(conn)
+                return False
+            if not self.ack(conn, events):
+                log.warning("Order outbox lease expired while publishing; the batch may be sent again")
+            if len(events) < self.batch:
+                return True
+
+    def _run(self):
+        conn = sqlite3.connect(self.database)
+        conn.row_factory = sqlite3.Row
+        version = None
+        while not self._stopping.wait(self.interval):
+            try:
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current == version:
+                    continue
+                version = current
+                if not self.publish_pending(conn):
+                    version = None  # try again on the next poll
+            except Exception:
+                log.exception("Order outbox failed; retrying on the next poll")
+                version = None
+        conn.close()
+
+
+def start_order_outbox():
+    """before_request hook: make sure this process is consuming the outbox."""
+    current_app.extensions["order_outbox"].ensure_running()
+
+
+def _default_publisher():
+    topic_arn = os.environ.get("SNS_TOPIC_ARN")
+    if topic_arn:
+        return SnsPublisher(topic_arn, region_name=os.environ.get("AWS_REGION"))
+    return LogPublisher()
+
+
+def init_order_outbox(app, database):
+    app.config.setdefault("ORDER_OUTBOX", os.environ.get("ORDER_OUTBOX", "1") != "0")
+    app.config.setdefault("ORDER_OUTBOX_POLL_SECONDS", 1.0)
+    app.config.setdefault("ORDER_OUTBOX_CONSUMER", CONSUMER)
+    app.config.setdefault("ORDER_OUTBOX_PUBLISHER", None)
+    app.config.setdefault("ORDER_OUTBOX_LEASE_SECONDS", LEASE_SECONDS)
+    if not app.config["ORDER_OUTBOX"]:
+        return
+
+    name = app.config["ORDER_OUTBOX_CONSUMER"]
+    conn = sqlite3.connect(database)
+    try:
+        register_consumer(conn, name)
+        conn.commit()
+    finally:
+        conn.close()
+
+    dispatcher = NotificationDispatcher(app.config["ORDER_OUTBOX_PUBLISHER"] or _default_publisher())
+    app.extensions["order_outbox"] = OrderOutbox(
+        database, dispatcher, app.config["ORDER_OUTBOX_POLL_SECONDS"], name, app.config["ORDER_OUTBOX_LEASE_SECONDS"]
+    )
+    app.before_request(start_order_outbox)
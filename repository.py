@@ -0,0 +1,387 @@
+"""
+Storage interface shared by the SQLite app (app.py + routes/) and the AWS
+app (app_aws.py).
+
+``Repository`` lists the user/product/order operations both front-ends need,
+including batch reads and writes, so that N lookups become one round trip
+on either backend. ``SQLiteRepository`` implements it on the per-request
+sqlite3 connection; ``dynamo_store.DynamoStore`` implements it on DynamoDB.
+"""
+
+import hashlib
+import sqlite3
+from abc import ABC, abstractmethod
+
+from flask import g
+
+from db import get_db
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+PRODUCT_SORTS = {
+    "rating_desc": "avg_rating DESC, rating_count DESC, p.created_at DESC",
+    "price_asc": "p.price ASC, p.created_at DESC",
+    "price_desc": "p.price DESC, p.created_at DESC",
+}
+
+
+class DuplicateOrder(Exception):
+    """``create_order`` was given an idempotency key that already placed ``order_id``."""
+
+    def __init__(self, order_id):
+        super().__init__(f"order {order_id} was already placed with this idempotency key")
+        self.order_id = order_id
+
+
+def checkout_idempotency_key(key, cart):
+    """Bind a checkout form's idempotency key to the session cart it is submitted with.
+
+    Resubmitting the form with the same cart maps to the same order. A stale
+    form (restored by the back button, say) sent with a different cart is a
+    different checkout and places its own order.
+    """
+    if not key:
+        return None
+    contents = ",".join(f"{product_id}x{quantity}" for product_id, quantity in sorted(
+        (str(product_id), int(quantity)) for product_id, quantity in cart.items()
+    ))
+    return f"{key}:{hashlib.sha256(contents.encode()).hexdigest()[:16]}"
+
+
+class Repository(ABC):
+    """Backend-neutral storage operations. Keys are ints on SQLite and strings on DynamoDB.
+
+    Every operation is abstract, so a backend that misses one fails when it
+    is instantiated rather than when a page first calls it.
+    """
+
+    # Users
+    @abstractmethod
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_user_for_login(self, login):
+        """Look a user up by what they log in with (email on SQLite, username on DynamoDB)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_user(self, fields):
+        raise NotImplementedError
+
+    # Products
+    @abstractmethod
+    def get_product(self, product_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch_get_products(self, product_ids):
+        """Return {product_id: product} for the ids that exist, in one round trip."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_products(self, category=None, limit=None, min_price=None, max_price=None,
+                      min_rating=None, sort=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_product(self, fields):
+        raise NotImplementedError
+
+    # Orders
+    @abstractmethod
+    def reserve_stock(self, lines):
+        """Take each line's quantity out of its product's stock.
+
+        Returns the ids of products without enough stock (empty when all
+        were reserved); the caller then rolls back. Products whose stock is
+        not tracked always succeed.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_stock(self, order_ids):
+        """Put the items of the given orders back into stock (they were cancelled)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_order(self, header, lines, idempotency_key=None):
+        """Write an order header and its lines together; returns the order id.
+
+        An ``idempotency_key`` (see ``checkout_idempotency_key``) is stored
+        with the order. If the key already placed an order, nothing is
+        written and ``DuplicateOrder`` is raised with that order's id, so the
+        caller knows not to announce it again.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_order_by_idempotency_key(self, user_id, idempotency_key):
+        """The order ``user_id`` already placed with this key, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_orders(self, status=None, limit=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_user_orders(self, user_id, limit=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch_get_order_items(self, order_ids):
+        """Return {order_id: [line, ...]} for all the given orders in one round trip."""
+        raise NotImplementedError
+
+    def iter_orders_with_items(self, user_id=None):
+        """Yield (order, [line, ...]) newest first, for one user or for everyone.
+
+        Backends that can read orders incrementally override this so that a
+        page can stream them (see streaming.py).
+        """
+        orders = self.list_orders() if user_id is None else self.list_user_orders(user_id)
+        items = self.batch_get_order_items([order["id"] for order in orders])
+        for order in orders:
+            yield order, items[order["id"]]
+
+
+class SQLiteRepository(Repository):
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def _placeholders(values):
+        return ", ".join("?" for _ in values)
+
+    @staticmethod
+    def _chunks(values):
+        for i in range(0, len(values), BATCH_SIZE):
+            yield values[i:i + BATCH_SIZE]
+
+    # -------------------------------------------------
+    # Users
+    # -------------------------------------------------
+    def get_user(self, user_id):
+        return self.db.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+    def find_user_for_login(self, login):
+        return self.db.execute("SELECT * FROM users WHERE email = ?", (login,)).fetchone()
+
+    def create_user(self, fields):
+        res = self.db.execute(
+            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+            (fields["name"], fields["email"], fields["password"])
+        )
+        return res.lastrowid
+
+    # -------------------------------------------------
+    # Products
+    # -------------------------------------------------
+    def get_product(self, product_id):
+        return self.db.execute("SELECT * FROM products WHERE id = ?", (product_id,)).fetchone()
+
+    def batch_get_products(self, product_ids):
+        ids = list({int(pid) for pid in product_ids})
+        products = {}
+        for chunk in self._chunks(ids):
+            rows = self.db.execute(
+                f"SELECT * FROM products WHERE id IN ({self._placeholders(chunk)})", chunk
+            ).fetchall()
+            products.update((row["id"], row) for row in rows)
+        return products
+
+    def list_products(self, category=None, limit=None, min_price=None, max_price=None,
+                      min_rating=None, sort=None):
+        # Ratings come from user reviews
+        query = """
+            SELECT
+                p.*,
+                COALESCE(AVG(r.rating), 0) AS avg_rating,
+                COUNT(r.id) AS rating_count
+            FROM products p
+            LEFT JOIN product_reviews r ON r.product_id = p.id
+            WHERE 1=1
+        """
+        params = []
+        if min_price is not None:
+            query += " AND p.price >= ?"
+            params.append(min_price)
+        if max_price is not None:
+            query += " AND p.price <= ?"
+            params.append(max_price)
+        if category:
+            query += " AND p.category = ?"
+            params.append(category)
+        query += " GROUP BY p.id "
+        if min_rating is not None:
+            query += " HAVING COALESCE(AVG(r.rating), 0) >= ? "
+            params.append(min_rating)
+        query += " ORDER BY " + PRODUCT_SORTS.get(sort, "p.created_at DESC")
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self.db.execute(query, tuple(params)).fetchall()
+
+    def create_product(self, fields):
+        res = self.db.execute(
+            "INSERT INTO products (name, description, price, image_url, category, rating, stock) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (fields["name"], fields.get("description"), fields["price"], fields.get("image_url"),
+             fields.get("category"), fields.get("rating", 0.0), fields.get("stock"))
+        )
+        return res.lastrowid
+
+    # -------------------------------------------------
+    # Stock (NULL stock is not tracked)
+    # -------------------------------------------------
+    def reserve_stock(self, lines):
+        """One conditional UPDATE over all the lines, so stock never goes below zero.
+
+        Only products with enough stock are decremented; RETURNING names them,
+        and the rest are short. Call it after ``BEGIN IMMEDIATE``: the write
+        lock is then held from the decrement to the commit, and concurrent
+        checkouts queue on it instead of deadlocking on a read-to-write lock
+        upgrade.
+        """
+        wanted = {}
+        for line in lines:
+            wanted[line["product_id"]] = wanted.get(line["product_id"], 0) + line["quantity"]
+        reserved = set()
+        for chunk in self._chunks(sorted(wanted.items())):
+            rows = self.db.execute(
+                f"""UPDATE products SET stock = stock - wanted.quantity
+                   FROM (SELECT column1 AS id, column2 AS quantity
+                         FROM (VALUES {", ".join("(?, ?)" for _ in chunk)})) AS wanted
+                   WHERE products.id = wanted.id AND (products.stock IS NULL OR products.stock >= wanted.quantity)
+                   RETURNING products.id""",
+                [value for pair in chunk for value in pair]
+            ).fetchall()
+            reserved.update(row[0] for row in rows)
+        return [product_id for product_id in sorted(wanted) if product_id not in reserved]
+
+    def release_stock(self, order_ids):
+        ids = list(order_ids)
+        for chunk in self._chunks(ids):
+            placeholders = self._placeholders(chunk)
+            self.db.execute(
+                f"""UPDATE products
+                   SET stock = stock + (SELECT SUM(oi.quantity) FROM order_items oi
+                                        WHERE oi.product_id = products.id AND oi.order_id IN ({placeholders}))
+                   WHERE stock IS NOT NULL
+                     AND id IN (SELECT product_id FROM order_items WHERE order_id IN ({placeholders}))""",
+                chunk + chunk
+            )
+
+    # -------------------------------------------------
+    # Orders
+    # -------------------------------------------------
+    def create_order(self, header, lines, idempotency_key=None):
+        """Insert the order and its lines; the caller commits (or rolls back) the transaction.
+
+        A key this user already used fails on the unique index on
+        ``(user_id, idempotency_key)`` and raises ``DuplicateOrder``.
+        """
+        if idempotency_key:
+            header = {**header, "idempotency_key": idempotency_key}
+        columns = list(header)
+        try:
+            res = self.db.execute(
+                f"INSERT INTO orders ({', '.join(columns)}) VALUES ({self._placeholders(columns)})",
+                [header[c] for c in columns]
+            )
+        except sqlite3.IntegrityError as e:
+            existing = idempotency_key and self.find_order_by_idempotency_key(header["user_id"], idempotency_key)
+            if existing:
+                raise DuplicateOrder(existing["id"]) from e
+            raise
+        order_id = res.lastrowid
+        self.db.executemany(
+            "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+            [(order_id, line["product_id"], line["quantity"], line["price"]) for line in lines]
+        )
+        return order_id
+
+    def find_order_by_idempotency_key(self, user_id, idempotency_key):
+        return self.db.execute(
+            "SELECT * FROM orders WHERE user_id = ? AND idempotency_key = ?", (user_id, idempotency_key)
+        ).fetchone()
+
+    def list_orders(self, status=None, limit=None):
+        query = """SELECT o.*, u.name as user_name, u.email as user_email
+                   FROM orders o
+                   JOIN users u ON o.user_id = u.id"""
+        params = []
+        if status:
+            query += " WHERE o.status = ?"
+            params.append(status)
+        query += " ORDER BY o.created_at DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self.db.execute(query, params).fetchall()
+
+    def list_user_orders(self, user_id, limit=None):
+        query = "SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC"
+        params = [user_id]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return self.db.execute(query, params).fetchall()
+
+    def batch_get_order_items(self, order_ids):
+        ids = list(order_ids)
+        items = {order_id: [] for order_id in ids}
+        for chunk in self._chunks(ids):
+            rows = self.db.execute(
+                f"""SELECT oi.*, p.name, p.description
+                   FROM order_items oi
+                   JOIN products p ON oi.product_id = p.id
+                   WHERE oi.order_id IN ({self._placeholders(chunk)})
+                   ORDER BY oi.order_id, oi.id""",
+                chunk
+            ).fetchall()
+            for row in rows:
+                items[row["order_id"]].append(row)
+        return items
+
+    def iter_orders_with_items(self, user_id=None):
+        # Two cursors in the same order, walked side by side: orders, and
+        # the lines of those orders. CROSS JOIN keeps orders as the outer
+        # loop, so with idx_orders_created / idx_orders_user_created no
+        # sort is needed and rows arrive as soon as the page asks for them.
+        # Both statements stay active together, so they read one snapshot.
+        # In WAL mode (db.init_db) that snapshot does not hold writers up.
+        where, params = ("", ()) if user_id is None else ("WHERE o.user_id = ?", (user_id,))
+        order_by = "ORDER BY o.created_at DESC, o.id DESC"
+        orders = self.db.execute(
+            f"""SELECT o.*, u.name AS user_name, u.email AS user_email
+               FROM orders o
+               CROSS JOIN users u ON u.id = o.user_id
+               {where} {order_by}""",
+            params
+        )
+        lines = self.db.execute(
+            f"""SELECT oi.*, p.name, p.description
+               FROM orders o
+               CROSS JOIN users u ON u.id = o.user_id
+               CROSS JOIN order_items oi ON oi.order_id = o.id
+               JOIN products p ON p.id = oi.product_id
+               {where} {order_by}, oi.id""",
+            params
+        )
+        line = next(lines, None)
+        for order in orders:
+            order_items = []
+            while line is not None and line["order_id"] == order["id"]:
+                order_items.append(line)
+                line = next(lines, None)
+            yield order, order_items
+
+
+def get_repository():
+    """SQLite repository bound to this request's connection."""
+    db = get_db()
+    repo = getattr(g, "_repository", None)
+    if repo is None or repo.db is not db:
+        repo = g._repository = SQLiteRepository(db)
+    return repo
@@ -0,0 +1,254 @@
+"""
+Opt-in per-request profiling, for finding out where a slow route spends
+its time (SQL, Jinja rendering or Python code).
+
+Nothing is profiled unless ``PROFILE_DIR`` is set. A request is then
+profiled when:
+
+* it sends ``X-Profile: <PROFILE_TOKEN>`` or ``?_profile=<PROFILE_TOKEN>``
+  (when no token is configured, a logged-in admin can use any value), or
+* it is picked by ``PROFILE_SAMPLE_RATE`` (0.0-1.0), optionally only for
+  the endpoints in ``PROFILE_ENDPOINTS``, e.g.
+  ``{"product.products", "admin.admin_orders"}``.
+
+``PROFILE_MODE = "sample"`` (the default) samples the request thread's
+stack every ``PROFILE_INTERVAL_MS`` and writes ``<...>.folded``: one
+``frame;frame;frame count`` line per stack, the input of flamegraph.pl
+and speedscope. ``"cprofile"`` runs cProfile instead and writes a
+``.prof`` file (pstats, snakeviz, flameprof).
+
+Limits that bound the overhead:
+
+* at most ``PROFILE_MAX_CONCURRENT`` requests are profiled at once and at
+  most ``PROFILE_MAX_PER_MINUTE`` per process; other requests run normally;
+* the sampler stops after ``PROFILE_MAX_SECONDS`` and records at most
+  ``PROFILE_MAX_DEPTH`` frames per stack;
+* only the newest ``PROFILE_MAX_FILES`` files are kept in ``PROFILE_DIR``.
+"""
+
+import glob
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from flask import current_app, g, request, session
+
+log = logging.getLogger(__name__)
+
+HEADER = "X-Profile"
+QUERY_ARG = "_profile"
+
+
+# -------------------------------------------------
+# Profilers
+# -------------------------------------------------
+class StackSampler:
+    """Samples one thread's Python stack from a background thread."""
+
+    suffix = ".folded"
+
+    def __init__(self, root, interval, max_seconds, max_depth):
+        self.root = root
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.truncated = False
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._labels = {}
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            if path.startswith(self.root):
+                path = os.path.relpath(path, self.root)
+            else:
+                path = os.path.join(*path.split(os.sep)[-2:]) if os.sep in path else path
+            label = self._labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        deadline = time.perf_counter() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() > deadline:
+                self.truncated = True
+                return
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CProfiler:
+    """Deterministic profile of the request thread (not time-limited)."""
+
+    suffix = ".prof"
+    truncated = False
+
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+
+# -------------------------------------------------
+# Limits
+# -------------------------------------------------
+class ProfileBudget:
+    """Concurrency and per-minute caps shared by all requests of an app."""
+
+    def __init__(self, max_concurrent, max_per_minute):
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._max_per_minute = max_per_minute
+        self._started = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._started and now - self._started[0] > 60:
+                self._started.popleft()
+            if len(self._started) >= self._max_per_minute:
+                self._slots.release()
+                return False
+            self._started.append(now)
+        return True
+
+    def release(self):
+        self._slots.release()
+
+
+def prune(directory, keep):
+    """Delete all but the newest ``keep`` profiles in ``directory``."""
+    paths = glob.glob(os.path.join(directory, "*.folded")) + glob.glob(os.path.join(directory, "*.prof"))
+    if len(paths) <= keep:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:len(paths) - keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# -------------------------------------------------
+# Flask integration
+# -------------------------------------------------
+def _requested(config):
+    value = request.headers.get(HEADER) or request.args.get(QUERY_ARG)
+    if not value:
+        return False
+    token = config["PROFILE_TOKEN"]
+    if token:
+        return hmac.compare_digest(value, token)
+    return "admin_id" in session
+
+
+def _sampled(config):
+    rate = config["PROFILE_SAMPLE_RATE"]
+    if not rate:
+        return False
+    endpoints = config["PROFILE_ENDPOINTS"]
+    if endpoints and request.endpoint not in endpoints:
+        return False
+    return random.random() < rate
+
+
+def start_request_profile():
+    config = current_app.config
+    if not config["PROFILE_DIR"] or request.endpoint in (None, "static"):
+        return
+    if not (_requested(config) or _sampled(config)):
+        return
+    budget = current_app.extensions["request_profiler"]
+    if not budget.acquire():
+        log.debug("Profiling limit reached, not profiling %s %s", request.method, request.path)
+        return
+    if config["PROFILE_MODE"] == "cprofile":
+        profiler = CProfiler()
+    else:
+        profiler = StackSampler(
+            current_app.root_path,
+            config["PROFILE_INTERVAL_MS"] / 1000,
+            config["PROFILE_MAX_SECONDS"],
+            config["PROFILE_MAX_DEPTH"],
+        )
+    g._request_profiler = (profiler, time.perf_counter())
+    profiler.start()
+
+
+def finish_request_profile(exc=None):
+    started = g.pop("_request_profiler", None)
+    if started is None:
+        return
+    profiler, started_at = started
+    config = current_app.config
+    try:
+        profiler.stop()
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        directory = config["PROFILE_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        name = (f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request.method}-"
+                f"{request.endpoint}-{elapsed_ms:.0f}ms{profiler.suffix}")
+        path = os.path.join(directory, name)
+        profiler.write(path)
+        prune(directory, config["PROFILE_MAX_FILES"])
+        log.info("Profiled %s %s (%.0f ms%s): %s", request.method, request.path, elapsed_ms,
+                 ", truncated" if profiler.truncated else "", path)
+    except OSError as e:
+        log.warning("Could not write request profile: %s", e)
+    finally:
+        current_app.extensions["request_profiler"].release()
+
+
+def init_request_profiler(app):
+    """Register the profiling hooks; profiling stays off until PROFILE_DIR is set."""
+    app.config.setdefault("PROFILE_DIR", os.environ.get("PROFILE_DIR"))
+    app.config.setdefault("PROFILE_TOKEN", os.environ.get("PROFILE_TOKEN"))
+    app.config.setdefault("PROFILE_SAMPLE_RATE", float(os.environ.get("PROFILE_SAMPLE_RATE", 0)))
+    app.config.setdefault("PROFILE_ENDPOINTS", None)
+    app.config.setdefault("PROFILE_MODE", "sample")
+    app.config.setdefault("PROFILE_INTERVAL_MS", 5)
+    app.config.setdefault("PROFILE_MAX_SECONDS", 10)
+    app.config.setdefault("PROFILE_MAX_DEPTH", 64)
+    app.config.setdefault("PROFILE_MAX_CONCURRENT", 1)
+    app.config.setdefault("PROFILE_MAX_PER_MINUTE", 30)
+    app.config.setdefault("PROFILE_MAX_FILES", 200)
+    app.extensions["request_profiler"] = ProfileBudget(
+        app.config["PROFILE_MAX_CONCURRENT"], app.config["PROFILE_MAX_PER_MINUTE"]
+    )
+    app.before_request(start_request_profile)
+    app.teardown_request(finish_request_profile)
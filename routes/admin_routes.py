@@ -1,6 +1,15 @@
-from flask import Blueprint, render_template, request, redirect, session, flash, url_for, current_app
+from flask import Blueprint, render_template, request, redirect, session, flash, url_for, current_app, jsonify
 from db import get_db
-from werkzeug.utils import secure_filename
+from config_cache import get_contact_info, get_upi_qr, bump_config_version
+from image_pipeline import schedule_variants
+from order_events import (
+    changed_orders, event_stream_response, latest_event_id, record_status_change, record_status_changes,
+    status_durations,
+)
+from repository import get_repository
+from streaming import stream_page
+from upload_store import store_upload
+import json
 import os
 
 def allowed_file(filename):
@@ -8,6 +17,15 @@ def allowed_file(filename):
 
 admin_bp = Blueprint("admin", __name__)
 
+# Status changes the bulk action allows; the same steps as the buttons on each order card
+ORDER_TRANSITIONS = {
+    "pending": {"accepted", "cancelled"},
+    "accepted": {"processing", "cancelled"},
+    "processing": {"shipped", "cancelled"},
+    "shipped": {"delivered"},
+    "delivered": {"completed"},
+}
+
 def admin_required(f):
     """Decorator to require admin login"""
     def decorated_function(*args, **kwargs):
@@ -58,6 +76,11 @@ def admin_login():
 def admin_dashboard():
     db = get_db()
     
+    # Read the counters and the live-feed cursor from one snapshot, so the
+    # feed adds exactly the orders these counts do not include yet
+    db.execute("BEGIN")
+    events_cursor = latest_event_id(db)
+    
     # Get statistics
     total_products = db.execute("SELECT COUNT(*) as count FROM products").fetchone()["count"]
     total_orders = db.execute("SELECT COUNT(*) as count FROM orders").fetchone()["count"]
@@ -65,20 +88,17 @@ def admin_dashboard():
     total_revenue = db.execute("SELECT COALESCE(SUM(total), 0) as total FROM orders").fetchone()["total"]
     
     # Get recent orders
-    recent_orders = db.execute(
-        """SELECT o.*, u.name as user_name, u.email as user_email 
-           FROM orders o 
-           JOIN users u ON o.user_id = u.id 
-           ORDER BY o.created_at DESC LIMIT 10"""
-    ).fetchall()
+    recent_orders = get_repository().list_orders(limit=10)
     
     # Get recent products
     recent_products = db.execute(
         "SELECT * FROM products ORDER BY created_at DESC LIMIT 5"
     ).fetchall()
+    db.commit()
     
     return render_template(
         "admin_dashboard.html",
+        events_cursor=events_cursor,
         total_products=total_products,
         total_orders=total_orders,
         total_users=total_users,
@@ -106,6 +126,7 @@ def add_product():
         image_url = request.form.get("image_url", "").strip()
         category = request.form.get("category", "").strip()
         rating = request.form.get("rating", "").strip()
+        stock = request.form.get("stock", "").strip()
         
         # Validation
         if not name or not price:
@@ -130,6 +151,12 @@ def add_product():
                 rating = 0.0
         else:
             rating = 0.0
+
+        # Empty stock: not tracked
+        if stock and not stock.isdigit():
+            flash("Stock must be a whole number of units.", "error")
+            return render_template("admin_add_product.html")
+        stock = int(stock) if stock else None
         
         # Auto-detect category if not provided
         if not category:
@@ -140,12 +167,9 @@ def add_product():
         uploaded_file = request.files.get('image_file')
         if uploaded_file and uploaded_file.filename:
             if allowed_file(uploaded_file.filename):
-                filename = secure_filename(uploaded_file.filename)
-                # Add timestamp to make filename unique
-                import time
-                filename = str(int(time.time())) + '_' + filename
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                uploaded_file.save(filepath)
+                # Content-addressed name; thumbnails/WebP variants are built in the background
+                filename = store_upload(uploaded_file, current_app.config['UPLOAD_FOLDER'])
+                schedule_variants(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
                 # Use the uploaded file path
                 image_url = url_for('static', filename=f'uploads/{filename}')
             else:
@@ -154,10 +178,15 @@ def add_product():
         
         db = get_db()
         try:
-            db.execute(
-                "INSERT INTO products (name, description, price, image_url, category, rating) VALUES (?, ?, ?, ?, ?, ?)",
-                (name, description, price, image_url, category, rating)
-            )
+            get_repository().create_product({
+                "name": name,
+                "description": description,
+                "price": price,
+                "image_url": image_url,
+                "category": category,
+                "rating": rating,
+                "stock": stock,
+            })
             db.commit()
             flash(f"Product '{name}' added successfully! Category: {category}", "success")
             return redirect("/admin/products")
@@ -169,6 +198,29 @@ def add_product():
     return render_template("admin_add_product.html")
 
 
+@admin_bp.route("/admin/products/<int:product_id>/stock", methods=["POST"])
+@admin_required
+def update_product_stock(product_id):
+    stock = request.form.get("stock", "").strip()
+    expected = request.form.get("expected", "").strip()
+    if (stock and not stock.isdigit()) or (expected and not expected.isdigit()):
+        flash("Stock must be a whole number of units.", "error")
+        return redirect("/admin/products")
+
+    db = get_db()
+    # Only overwrite the value the form showed; checkouts may have sold units since
+    res = db.execute(
+        "UPDATE products SET stock = ? WHERE id = ? AND stock IS ?",
+        (int(stock) if stock else None, product_id, int(expected) if expected else None)
+    )
+    db.commit()
+    if res.rowcount == 0:
+        flash("Stock changed since the page was loaded (or the product is gone). Please check it again.", "error")
+    else:
+        flash("Stock updated." if stock else "Stock is no longer tracked for this product.", "success")
+    return redirect("/admin/products")
+
+
 @admin_bp.route("/admin/products/delete/<int:product_id>", methods=["POST"])
 @admin_required
 def delete_product(product_id):
@@ -205,32 +257,67 @@ def delete_product(product_id):
 @admin_bp.route("/admin/orders")
 @admin_required
 def admin_orders():
+    # Set by orders_with_items() before the first card; the page reads it after the last one
+    feed = {}
+
+    # All orders with user information and items, read from the cursor while the page streams out
+    def orders_with_items():
+        # The body streams after this request's teardown, on a connection of its own (see close_db).
+        # The live-feed cursor is read just before the orders, so the cards are at least as new
+        # as the cursor. A change in between comes again from the feed, which replaces the card.
+        # No transaction is held across the yields; the open cursor's WAL snapshot blocks no writer.
+        feed["cursor"] = latest_event_id(get_db())
+        for order, items in get_repository().iter_orders_with_items():
+            yield {"order": order, "order_items": items}
+
+    return stream_page("admin_orders.html", orders_with_items=orders_with_items(), feed=feed)
+
+
+@admin_bp.route("/admin/orders/events")
+@admin_required
+def admin_order_events():
+    """Server-Sent Events stream of every order placed or changed."""
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    return event_stream_response(current_app, get_db(), None, last_event_id)
+
+
+@admin_bp.route("/admin/api/orders/since/<int:event_id>")
+@admin_required
+def admin_orders_since(event_id):
+    """Orders placed or changed after ``event_id``, rendered for the dashboard (?view=row) or orders page (?view=card)."""
     db = get_db()
-    
-    # Get all orders with user information
-    orders = db.execute(
-        """SELECT o.*, u.name as user_name, u.email as user_email 
-           FROM orders o 
-           JOIN users u ON o.user_id = u.id 
-           ORDER BY o.created_at DESC"""
-    ).fetchall()
-    
-    # Get order items for each order
-    orders_with_items = []
+    cursor, orders, placed_ids, more = changed_orders(db, event_id)
+    view = request.args.get("view", "row")
+    items_by_order = get_repository().batch_get_order_items([order["id"] for order in orders]) if view == "card" else {}
+    changed = []
     for order in orders:
-        items = db.execute(
-            """SELECT oi.*, p.name, p.description 
-               FROM order_items oi 
-               JOIN products p ON oi.product_id = p.id 
-               WHERE oi.order_id = ?""",
-            (order["id"],)
-        ).fetchall()
-        orders_with_items.append({
-            "order": order,
-            "order_items": items
-        })
-    
-    return render_template("admin_orders.html", orders_with_items=orders_with_items)
+        if view == "card":
+            html = render_template(
+                "partials/_admin_order_card.html",
+                order_data={"order": order, "order_items": items_by_order[order["id"]]}
+            )
+        else:
+            html = render_template("partials/_admin_order_row.html", order=order)
+        changed.append({"id": order["id"], "status": order["status"], "placed": order["id"] in placed_ids, "html": html})
+    return jsonify({
+        "cursor": cursor,
+        "more": more,
+        "orders": changed,
+        "added": {
+            "orders": len(placed_ids),
+            "revenue": sum(order["total"] for order in orders if order["id"] in placed_ids),
+        },
+    })
+
+
+@admin_bp.route("/admin/api/orders/status-durations")
+@admin_required
+def admin_status_durations():
+    """Time orders spend in each status, from the order history (?days=N: statuses entered in the last N days)."""
+    from datetime import datetime, timedelta
+    days = request.args.get("days", type=int)
+    since = (datetime.now() - timedelta(days=days)).isoformat(timespec="seconds") if days else None
+    return jsonify({"since": since, "statuses": status_durations(get_db(), since)})
 
 
 @admin_bp.route("/admin/orders/update-status/<int:order_id>", methods=["POST"])
@@ -253,11 +340,30 @@ def update_order_status(order_id):
         return redirect("/admin/orders")
     
     try:
-        # Update order status and timestamp
-        db.execute(
-            "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
-            (new_status, datetime.now().isoformat(timespec="seconds"), order_id)
+        # Update order status and timestamp, unless it changed since it was read
+        res = db.execute(
+            "UPDATE orders SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+            (new_status, datetime.now().isoformat(timespec="seconds"), order_id, order["status"])
         )
+        if res.rowcount == 0:
+            db.rollback()
+            flash("The order was just updated by someone else. Please try again.", "error")
+            return redirect("/admin/orders")
+
+        # A cancelled order gives its items back; reopening one takes them again
+        repo = get_repository()
+        if new_status == "cancelled" and order["status"] != "cancelled":
+            repo.release_stock([order_id])
+        elif order["status"] == "cancelled" and new_status != "cancelled":
+            lines = db.execute(
+                "SELECT product_id, quantity FROM order_items WHERE order_id = ?", (order_id,)
+            ).fetchall()
+            if repo.reserve_stock(lines):
+                db.rollback()
+                flash("Not enough stock left to reopen this order.", "error")
+                return redirect("/admin/orders")
+
+        record_status_change(db, order_id, order["user_id"], order["status"], new_status)
         
         # If order is delivered or completed, mark payment as completed if COD
         if new_status in ["delivered", "completed"] and order["payment_method"] == "cod":
@@ -286,6 +392,71 @@ def update_order_status(order_id):
     return redirect("/admin/orders")
 
 
+@admin_bp.route("/admin/orders/bulk-status", methods=["POST"])
+@admin_required
+def bulk_update_order_status():
+    """Move many orders to one status in a single transaction; orders that cannot make that step are skipped."""
+    from datetime import datetime
+    new_status = request.form.get("status", "").strip().lower()
+    order_ids = sorted({int(v) for v in request.form.getlist("order_ids") if v.isdigit()})
+    wants_json = request.accept_mimetypes.best == "application/json"
+
+    def done(message, category, status=200, **extra):
+        if wants_json:
+            return jsonify(message=message, **extra), status
+        flash(message, category)
+        return redirect("/admin/orders")
+
+    if not any(new_status in allowed for allowed in ORDER_TRANSITIONS.values()):
+        return done("Invalid status!", "error", 400)
+    if not order_ids:
+        return done("Select at least one order.", "error", 400)
+
+    db = get_db()
+    try:
+        # Take the write lock first so no other change lands between the check and the update
+        db.execute("BEGIN IMMEDIATE")
+        orders = db.execute(
+            "SELECT id, user_id, status FROM orders WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(order_ids),)
+        ).fetchall()
+        eligible = [o for o in orders if new_status in ORDER_TRANSITIONS.get(o["status"].lower(), ())]
+        updated_ids = [o["id"] for o in eligible]
+
+        now = datetime.now().isoformat(timespec="seconds")
+        db.executemany(
+            "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
+            [(new_status, now, order_id) for order_id in updated_ids]
+        )
+        # Delivered/completed COD orders have been paid: one set-based UPDATE
+        if new_status in ["delivered", "completed"] and updated_ids:
+            db.execute(
+                """UPDATE orders SET payment_status = 'completed'
+                   WHERE payment_method = 'cod' AND id IN (SELECT value FROM json_each(?))""",
+                (json.dumps(updated_ids),)
+            )
+        if new_status == "cancelled":
+            get_repository().release_stock(updated_ids)
+        record_status_changes(db, [(o["id"], o["user_id"], o["status"], new_status) for o in eligible])
+        db.commit()
+    except Exception:
+        db.rollback()
+        current_app.logger.exception("Bulk status update to %s failed", new_status)
+        return done("An error occurred while updating the orders.", "error", 500)
+
+    found = {o["id"] for o in orders}
+    updated = set(updated_ids)
+    missing = [order_id for order_id in order_ids if order_id not in found]
+    not_allowed = [order_id for order_id in order_ids if order_id in found and order_id not in updated]
+    message = f"{len(updated_ids)} order(s) marked as {new_status}."
+    if not_allowed:
+        message += f" {len(not_allowed)} cannot move to {new_status} from their current status."
+    if missing:
+        message += f" {len(missing)} not found."
+    return done(message, "success" if updated_ids else "error",
+                updated=updated_ids, missing=missing, not_allowed=not_allowed)
+
+
 @admin_bp.route("/admin/contact/qr", methods=["POST"])
 @admin_required
 def save_upi_qr():
@@ -296,16 +467,15 @@ def save_upi_qr():
         if not allowed_file(uploaded_file.filename):
             flash("Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP", "error")
             return redirect("/admin/contact")
-        import time
-        filename = str(int(time.time())) + "_upi_qr_" + secure_filename(uploaded_file.filename)
-        filepath = os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
-        uploaded_file.save(filepath)
+        # QR codes are stored content-addressed but not resized (lossy variants could break scanning)
+        filename = store_upload(uploaded_file, current_app.config["UPLOAD_FOLDER"])
         image_url = url_for("static", filename=f"uploads/{filename}")
     if not image_url:
         flash("Please upload a QR image or provide an image URL.", "error")
         return redirect("/admin/contact")
     try:
         db.execute("UPDATE upi_qr SET image_url = ?, updated_at = CURRENT_TIMESTAMP WHERE id = 1", (image_url,))
+        bump_config_version(db)
         db.commit()
         flash("UPI QR updated successfully!", "success")
     except Exception:
@@ -338,6 +508,7 @@ def add_coupon():
             "INSERT INTO coupons (code, discount_type, discount_value, is_active) VALUES (?, ?, ?, 1)",
             (code, discount_type, val)
         )
+        bump_config_version(db)
         db.commit()
         flash(f"Coupon {code} added.", "success")
     except Exception:
@@ -355,6 +526,7 @@ def toggle_coupon(cid):
         if row:
             new = 0 if row["is_active"] else 1
             db.execute("UPDATE coupons SET is_active = ? WHERE id = ?", (new, cid))
+            bump_config_version(db)
             db.commit()
             flash("Coupon status updated.", "success")
     except Exception:
@@ -369,6 +541,7 @@ def delete_coupon(cid):
     db = get_db()
     try:
         db.execute("DELETE FROM coupons WHERE id = ?", (cid,))
+        bump_config_version(db)
         db.commit()
         flash("Coupon deleted.", "success")
     except Exception:
@@ -396,14 +569,14 @@ def manage_contact():
         # Validation
         if not company_name or not email or not phone or not address:
             flash("Company name, email, phone, and address are required!", "error")
-            contact_info = db.execute("SELECT * FROM contact_info LIMIT 1").fetchone()
-            upi_qr = db.execute("SELECT * FROM upi_qr WHERE id = 1").fetchone()
+            contact_info = get_contact_info(db)
+            upi_qr = get_upi_qr(db)
             coupons = db.execute("SELECT * FROM coupons ORDER BY id DESC").fetchall()
             return render_template("admin_contact.html", contact_info=contact_info, upi_qr=upi_qr, coupons=coupons)
         
         try:
             # Check if contact info exists
-            existing = db.execute("SELECT * FROM contact_info LIMIT 1").fetchone()
+            existing = get_contact_info(db)
             
             if existing:
                 # Update existing
@@ -424,20 +597,21 @@ def manage_contact():
                     (company_name, email, phone, address, city, state, zip_code, country, website)
                 )
             
+            bump_config_version(db)
             db.commit()
             flash("Contact details updated successfully!", "success")
             return redirect("/admin/contact")
         except Exception as e:
             db.rollback()
             flash("An error occurred while updating contact details. Please try again.", "error")
-            contact_info = db.execute("SELECT * FROM contact_info LIMIT 1").fetchone()
-            upi_qr = db.execute("SELECT * FROM upi_qr WHERE id = 1").fetchone()
+            contact_info = get_contact_info(db)
+            upi_qr = get_upi_qr(db)
             coupons = db.execute("SELECT * FROM coupons ORDER BY id DESC").fetchall()
             return render_template("admin_contact.html", contact_info=contact_info, upi_qr=upi_qr, coupons=coupons)
     
     # GET - contact, UPI QR, coupons
-    contact_info = db.execute("SELECT * FROM contact_info LIMIT 1").fetchone()
-    upi_qr = db.execute("SELECT * FROM upi_qr WHERE id = 1").fetchone()
+    contact_info = get_contact_info(db)
+    upi_qr = get_upi_qr(db)
     coupons = db.execute("SELECT * FROM coupons ORDER BY id DESC").fetchall()
     return render_template("admin_contact.html", contact_info=contact_info, upi_qr=upi_qr, coupons=coupons)
 
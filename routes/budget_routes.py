@@ -2,8 +2,6 @@
 
 from flask import Blueprint, render_template, request, jsonify
 
-from budget_planner import run_budget_planner
-
 budget_bp = Blueprint("budget", __name__)
 
 
@@ -29,5 +27,6 @@ def budget_planner_api():
             "room_type": None,
             "categories": [],
         }), 400
+    from budget_planner import run_budget_planner  # only loaded once someone uses the planner
     result = run_budget_planner(user_input)
     return jsonify(result)
@@ -1,6 +1,12 @@
-from flask import Blueprint, render_template, session, redirect, flash, request
+from flask import Blueprint, render_template, session, redirect, flash, request, current_app, url_for
 from db import get_db
+from config_cache import get_active_coupon, get_upi_qr
+from order_events import event_stream_response, latest_event_id, record_order_placed, record_status_change
+from repository import DuplicateOrder, checkout_idempotency_key, get_repository
+from streaming import stream_page
+from upload_store import store_upload
 from datetime import datetime
+import uuid
 
 order_bp = Blueprint("order", __name__)
 
@@ -11,12 +17,12 @@ def cart():
     if not cart_dict:
         return render_template("cart.html", cart_items=[], total=0)
     
-    db = get_db()
+    products = get_repository().batch_get_products(cart_dict.keys())
     cart_items = []
     total = 0
     
     for product_id, quantity in cart_dict.items():
-        product = db.execute("SELECT * FROM products WHERE id = ?", (int(product_id),)).fetchone()
+        product = products.get(int(product_id))
         if product:
             item_total = product["price"] * quantity
             total += item_total
@@ -59,10 +65,7 @@ def _apply_coupon(db, code, total):
     """Validate coupon and return (coupon_row, discount_amount) or (None, 0)."""
     if not code or total <= 0:
         return None, 0.0
-    c = db.execute(
-        "SELECT * FROM coupons WHERE UPPER(TRIM(code)) = ? AND is_active = 1",
-        (code.strip().upper(),)
-    ).fetchone()
+    c = get_active_coupon(db, code)
     if not c:
         return None, 0.0
     if c["discount_type"] == "percent":
@@ -86,11 +89,12 @@ def checkout():
         return redirect("/products")
 
     db = get_db()
+    products = get_repository().batch_get_products(cart_dict.keys())
     cart_items = []
     total = 0
     
     for product_id, quantity in cart_dict.items():
-        product = db.execute("SELECT * FROM products WHERE id = ?", (int(product_id),)).fetchone()
+        product = products.get(int(product_id))
         if product:
             item_total = product["price"] * quantity
             total += item_total
@@ -100,7 +104,7 @@ def checkout():
                 "total": item_total
             })
     
-    upi_qr = db.execute("SELECT * FROM upi_qr WHERE id = 1").fetchone()
+    upi_qr = get_upi_qr(db)
 
     # Coupon: apply if ?coupon=CODE
     coupon_code = request.args.get("coupon", "").strip()
@@ -124,21 +128,48 @@ def checkout():
         upi_qr=upi_qr,
         applied_coupon=applied_coupon,
         discount_amount=discount_amount,
+        # One key per rendered checkout; a double-submitted or retried form reuses it
+        idempotency_key=uuid.uuid4().hex,
     )
 
 
+def _already_placed(order):
+    """Answer a resubmitted checkout with the order it placed the first time.
+
+    The key is bound to the cart, so this is the cart that order was placed
+    with. Empty it again, or this response's cookie would bring it back.
+    """
+    session["cart"] = {}
+    flash(f"Order #{order['id']} was already placed.", "success")
+    return redirect("/orders")
+
+
 @order_bp.route("/place-order", methods=["POST"])
 def place_order():
     if "user_id" not in session:
         flash("Please login to place an order.", "error")
         return redirect("/login")
 
+    repo = get_repository()
+    form_key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key") or None
+    if form_key and len(form_key) > 64:
+        flash("Invalid checkout form. Please try again.", "error")
+        return redirect("/checkout")
+
     cart_dict = session.get("cart", {})
     
     if not cart_dict:
         flash("Your cart is empty!", "error")
         return redirect("/products")
 
+    # A replayed form gets its order back before any other work. The key is bound to
+    # the cart, so a stale form sent with a different cart places a new order instead.
+    idempotency_key = checkout_idempotency_key(form_key, cart_dict)
+    if idempotency_key:
+        order = repo.find_order_by_idempotency_key(session["user_id"], idempotency_key)
+        if order:
+            return _already_placed(order)
+
     payment_method = request.form.get("payment_method", "cod").strip()
     
     # Validate payment method
@@ -162,11 +193,12 @@ def place_order():
         return redirect("/checkout")
 
     db = get_db()
+    products = repo.batch_get_products(cart_dict.keys())
     cart_items = []
     total = 0
     
     for product_id, quantity in cart_dict.items():
-        product = db.execute("SELECT * FROM products WHERE id = ?", (int(product_id),)).fetchone()
+        product = products.get(int(product_id))
         if product:
             item_total = product["price"] * quantity
             total += item_total
@@ -191,57 +223,63 @@ def place_order():
         if not proof or not proof.filename:
             flash("Please upload UPI payment screenshot to place the order.", "error")
             return redirect("/checkout")
-        from werkzeug.utils import secure_filename
-        import os
-        import time
-        filename = secure_filename(proof.filename)
-        filename = str(int(time.time())) + "_upi_proof_" + filename
-        upload_dir = os.path.join("static", "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-        filepath = os.path.join(upload_dir, filename)
-        proof.save(filepath)
-        payment_proof_url = "/" + filepath.replace("\\", "/")
+        filename = store_upload(proof, current_app.config["UPLOAD_FOLDER"])
+        payment_proof_url = url_for("static", filename=f"uploads/{filename}")
 
     if payment_method == "upi":
         payment_status = "awaiting_verification"
     else:
         payment_status = "pending"
 
+    lines = [
+        {"product_id": item["product"]["id"], "quantity": item["quantity"], "price": item["product"]["price"]}
+        for item in cart_items
+    ]
     try:
-        res = db.execute(
-            """INSERT INTO orders (user_id, total, status, payment_method, payment_status,
-               advance_amount, payment_proof_url, coupon_id, discount_amount, 
-               contact_mobile, contact_address, created_at, updated_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                session["user_id"],
-                total_final,
-                "pending",
-                payment_method,
-                payment_status,
-                advance_amount,
-                payment_proof_url,
-                coupon_id,
-                discount_amount,
-                contact_mobile,
-                contact_address,
-                datetime.now().isoformat(timespec="seconds"),
-                datetime.now().isoformat(timespec="seconds"),
-            )
+        now = datetime.now().isoformat(timespec="seconds")
+        # Stock, the order header and all items are written in one transaction. Taking the
+        # write lock up front serialises checkouts, so two cannot both sell the last unit.
+        db.execute("BEGIN IMMEDIATE")
+        if idempotency_key:
+            # A concurrent submit of the same form may have committed while this one waited for the lock
+            order = repo.find_order_by_idempotency_key(session["user_id"], idempotency_key)
+            if order:
+                db.rollback()
+                return _already_placed(order)
+        short = repo.reserve_stock(lines)
+        if short:
+            db.rollback()
+            names = ", ".join(products[product_id]["name"] for product_id in short)
+            flash(f"Sorry, not enough stock left for: {names}. Please update your cart.", "error")
+            return redirect("/cart")
+        order_id = repo.create_order(
+            {
+                "user_id": session["user_id"],
+                "total": total_final,
+                "status": "pending",
+                "payment_method": payment_method,
+                "payment_status": payment_status,
+                "advance_amount": advance_amount,
+                "payment_proof_url": payment_proof_url,
+                "coupon_id": coupon_id,
+                "discount_amount": discount_amount,
+                "contact_mobile": contact_mobile,
+                "contact_address": contact_address,
+                "created_at": now,
+                "updated_at": now,
+            },
+            lines,
+            idempotency_key=idempotency_key,
         )
-        order_id = res.lastrowid
-
-        # Add order items
-        for item in cart_items:
-            db.execute(
-                "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
-                (order_id, item["product"]["id"], item["quantity"], item["product"]["price"])
-            )
+        record_order_placed(db, order_id, session["user_id"])
 
         db.commit()
         session["cart"] = {}
         flash(f"Order placed successfully! Order ID: #{order_id}", "success")
         return redirect("/orders")
+    except DuplicateOrder as e:
+        db.rollback()
+        return _already_placed({"id": e.order_id})
     except Exception as e:
         db.rollback()
         flash("An error occurred while placing your order. Please try again.", "error")
@@ -254,11 +292,7 @@ def orders():
         flash("Please login to view your orders.", "error")
         return redirect("/login")
 
-    db = get_db()
-    orders = db.execute(
-        "SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC",
-        (session["user_id"],)
-    ).fetchall()
+    user_id = session["user_id"]
     
     # Define order status stages
     status_stages = {
@@ -271,29 +305,38 @@ def orders():
         "cancelled": {"label": "Cancelled", "icon": "❌", "order": 0}
     }
     
-    # Get order items for each order
-    orders_with_items = []
-    for order in orders:
-        items = db.execute(
-            """SELECT oi.*, p.name, p.description 
-               FROM order_items oi 
-               JOIN products p ON oi.product_id = p.id 
-               WHERE oi.order_id = ?""",
-            (order["id"],)
-        ).fetchall()
-        
-        # Determine current stage
-        current_status = order["status"].lower()
-        current_stage = status_stages.get(current_status, {"label": current_status.title(), "icon": "📦", "order": 0})
-        
-        orders_with_items.append({
-            "order": order,
-            "order_items": items,
-            "status_stages": status_stages,
-            "current_stage": current_stage
-        })
+    # Orders and their items are read from the cursor while the page streams out.
+    # The event cursor is read just before them, so the live stream resumes from
+    # there and a change committed before the browser connects is not missed.
+    feed = {}
+
+    def orders_with_items():
+        feed["cursor"] = latest_event_id(get_db())
+        for order, items in get_repository().iter_orders_with_items(user_id=user_id):
+            # Determine current stage
+            current_status = order["status"].lower()
+            current_stage = status_stages.get(current_status, {"label": current_status.title(), "icon": "📦", "order": 0})
+            
+            yield {
+                "order": order,
+                "order_items": items,
+                "status_stages": status_stages,
+                "current_stage": current_stage
+            }
     
-    return render_template("orders.html", orders_with_items=orders_with_items)
+    return stream_page("orders.html", orders_with_items=orders_with_items(), feed=feed)
+
+
+@order_bp.route("/orders/events")
+def order_status_events():
+    """Server-Sent Events stream of the user's order status changes."""
+    if "user_id" not in session:
+        return "Please login to follow your orders.", 401
+    # A reconnect sends Last-Event-ID; the first connect passes the page's cursor as ?after=
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get("after", type=int)
+    return event_stream_response(current_app, get_db(), session["user_id"], last_event_id)
 
 
 @order_bp.route("/rate-product/<int:product_id>", methods=["POST"])
@@ -373,11 +416,19 @@ def cancel_order(order_id):
         return redirect("/orders")
     
     try:
-        # Update order status to cancelled
-        db.execute(
-            "UPDATE orders SET status = ?, updated_at = ? WHERE id = ?",
-            ("cancelled", datetime.now().isoformat(timespec="seconds"), order_id)
+        # Update order status to cancelled, unless a concurrent request changed it meanwhile,
+        # and put its items back into stock in the same transaction
+        res = db.execute(
+            """UPDATE orders SET status = ?, updated_at = ?
+               WHERE id = ? AND status = ?""",
+            ("cancelled", datetime.now().isoformat(timespec="seconds"), order_id, order["status"])
         )
+        if res.rowcount == 0:
+            db.rollback()
+            flash("This order was just updated. Please check its status and try again.", "error")
+            return redirect("/orders")
+        get_repository().release_stock([order_id])
+        record_status_change(db, order_id, session["user_id"], order["status"], "cancelled")
         db.commit()
         flash(f"Order #{order_id} has been cancelled successfully!", "success")
     except Exception as e:
@@ -2,6 +2,7 @@
 
 from flask import Blueprint, render_template
 
+from config_cache import get_contact_info
 from db import get_db
 
 pages_bp = Blueprint("pages", __name__)
@@ -14,7 +15,7 @@ def about():
 
 @pages_bp.route("/contact")
 def contact():
-    contact_info = get_db().execute("SELECT * FROM contact_info LIMIT 1").fetchone()
+    contact_info = get_contact_info(get_db())
     return render_template("contact.html", contact_info=contact_info)
 
 
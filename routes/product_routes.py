@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, session, redirect, flash, request
 from db import get_db
+from repository import get_repository
 
 product_bp = Blueprint("product", __name__)
 
@@ -14,49 +15,14 @@ def products():
     category = request.args.get('category', type=str)
     sort = request.args.get('sort', type=str)  # 'rating_desc' | 'price_asc' | 'price_desc' | None
     
-    # Build query (use user reviews for rating)
-    query = """
-        SELECT
-            p.*,
-            COALESCE(AVG(r.rating), 0) AS avg_rating,
-            COUNT(r.id) AS rating_count
-        FROM products p
-        LEFT JOIN product_reviews r ON r.product_id = p.id
-        WHERE 1=1
-    """
-    params = []
-    
-    if min_price is not None:
-        query += " AND p.price >= ?"
-        params.append(min_price)
-    
-    if max_price is not None:
-        query += " AND p.price <= ?"
-        params.append(max_price)
-    
-    if category:
-        query += " AND p.category = ?"
-        params.append(category)
-    
-    # Filter by avg rating (HAVING after GROUP BY; add param after category)
-    having = ""
-    if min_rating is not None:
-        having = " HAVING COALESCE(AVG(r.rating), 0) >= ? "
-        params.append(min_rating)
-    
-    query += " GROUP BY p.id "
-    query += having
-
-    if sort == "rating_desc":
-        query += " ORDER BY avg_rating DESC, rating_count DESC, p.created_at DESC"
-    elif sort == "price_asc":
-        query += " ORDER BY p.price ASC, p.created_at DESC"
-    elif sort == "price_desc":
-        query += " ORDER BY p.price DESC, p.created_at DESC"
-    else:
-        query += " ORDER BY p.created_at DESC"
-    
-    products = db.execute(query, tuple(params)).fetchall()
+    # Ratings come from user reviews (see SQLiteRepository.list_products)
+    products = get_repository().list_products(
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        min_rating=min_rating,
+        sort=sort,
+    )
     
     # Get all unique categories for filter dropdown
     categories = db.execute("SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category").fetchall()
@@ -142,8 +108,7 @@ def wishlist():
 @product_bp.route("/add-to-cart/<int:pid>", methods=["POST"])
 def add_to_cart(pid):
     # Check if product exists
-    db = get_db()
-    product = db.execute("SELECT * FROM products WHERE id = ?", (pid,)).fetchone()
+    product = get_repository().get_product(pid)
     
     if not product:
         flash("Product not found!", "error")
@@ -151,6 +116,11 @@ def add_to_cart(pid):
     
     # Initialize cart as dict if not exists
     cart = session.get("cart", {})
+
+    # Stock is only reserved at checkout; this just stops carts asking for more than is left
+    if product["stock"] is not None and cart.get(str(pid), 0) >= product["stock"]:
+        flash(f"Sorry, only {product['stock']} of {product['name']} left in stock.", "error")
+        return redirect("/products")
     
     # Add or increment product in cart
     if str(pid) in cart:
@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, session, flash
 from db import get_db
+from repository import get_repository
+from config_cache import get_contact_info
 
 user_bp = Blueprint("user", __name__)
 
@@ -24,12 +26,10 @@ def register():
             return render_template("register.html")
         
         db = get_db()
+        repo = get_repository()
         
         # Check if email already exists
-        existing_user = db.execute(
-            "SELECT * FROM users WHERE email = ?", 
-            (email,)
-        ).fetchone()
+        existing_user = repo.find_user_for_login(email)
         
         if existing_user:
             flash("Email already registered! Please login instead.", "error")
@@ -37,10 +37,7 @@ def register():
         
         try:
             # Insert new user
-            db.execute(
-                "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
-                (name, email, password)
-            )
+            repo.create_user({"name": name, "email": email, "password": password})
             db.commit()
             flash("Registration successful! Please login.", "success")
             return redirect("/login")
@@ -67,13 +64,9 @@ def login():
             flash("Email and password are required!", "error")
             return render_template("login.html")
         
-        db = get_db()
-        user = db.execute(
-            "SELECT * FROM users WHERE email = ? AND password = ?",
-            (email, password)
-        ).fetchone()
+        user = get_repository().find_user_for_login(email)
         
-        if user:
+        if user and user["password"] == password:
             session["user_id"] = user["id"]
             session["user_name"] = user["name"]
             session["user_email"] = user["email"]
@@ -94,13 +87,11 @@ def dashboard():
         return redirect("/login")
     
     db = get_db()
+    repo = get_repository()
     user_id = session["user_id"]
     
     # Get user information
-    user = db.execute(
-        "SELECT * FROM users WHERE id = ?",
-        (user_id,)
-    ).fetchone()
+    user = repo.get_user(user_id)
     
     # Get user's order count
     order_count = db.execute(
@@ -109,10 +100,7 @@ def dashboard():
     ).fetchone()
     
     # Get recent orders
-    recent_orders = db.execute(
-        "SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC LIMIT 5",
-        (user_id,)
-    ).fetchall()
+    recent_orders = repo.list_user_orders(user_id, limit=5)
     
     # Get total spent
     total_spent = db.execute(
@@ -121,7 +109,7 @@ def dashboard():
     ).fetchone()
     
     # Get contact information
-    contact_info = db.execute("SELECT * FROM contact_info LIMIT 1").fetchone()
+    contact_info = get_contact_info(db)
     
     return render_template(
         "dashboard.html",
@@ -0,0 +1,174 @@
+"""
+Per-request SQL profiling for the SQLite connection returned by ``db.get_db``.
+
+With ``SQL_PROFILE`` on (the default), ``get_db`` opens the connection
+with ``factory=ProfiledConnection``. Every statement on it is timed,
+including the time spent fetching its rows, and collected on
+``connection.profile``. At the end of each request:
+
+* statements slower than ``SQL_SLOW_MS`` are logged with their
+  ``EXPLAIN QUERY PLAN``;
+* a statement run ``SQL_N_PLUS_ONE_THRESHOLD`` or more times with the
+  same SQL text is logged as a likely N+1 query;
+* with ``SQL_SERVER_TIMING`` on, a ``Server-Timing: db;dur=...`` header
+  reports the query count and total SQL time to the browser devtools.
+"""
+
+import logging
+import sqlite3
+import time
+
+from flask import current_app, g, request
+
+log = logging.getLogger(__name__)
+
+SLOWEST_KEPT = 5
+
+
+class QueryProfile:
+    """Statement timings for one connection (one request)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.statements = {}  # sql -> [executions, seconds]
+        self.executions = []  # [seconds, sql, params] per execute call
+
+    def record(self, sql, params, seconds):
+        self.count += 1
+        self.total += seconds
+        entry = self.statements.setdefault(sql, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        execution = [seconds, sql, params]
+        self.executions.append(execution)
+        return execution
+
+    def add_fetch_time(self, execution, seconds):
+        execution[0] += seconds
+        self.statements[execution[1]][1] += seconds
+        self.total += seconds
+
+    def slowest(self, n=SLOWEST_KEPT):
+        return sorted(self.executions, key=lambda e: -e[0])[:n]
+
+    def repeated(self, threshold):
+        return [(sql, n) for sql, (n, _) in self.statements.items() if n >= threshold]
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _execution = None
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._execution = self.connection.profile.record(sql, params, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_params):
+        rows = list(seq_of_params)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, rows)
+        finally:
+            # One call however many rows; the first row's params stand in for EXPLAIN
+            self._execution = self.connection.profile.record(
+                sql, rows[0] if rows else (), time.perf_counter() - started
+            )
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._execution is not None:
+                self.connection.profile.add_fetch_time(self._execution, time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        return self._fetch(super().__next__)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profile = QueryProfile()
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute* bypass cursor(); route them through ProfiledCursor
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def explain(self, sql, params=()):
+        """EXPLAIN QUERY PLAN lines for ``sql`` (not profiled)."""
+        try:
+            rows = sqlite3.Connection.execute(self, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error as e:
+            return [f"(no plan: {e})"]
+        return [row[-1] for row in rows]
+
+
+def connection_factory(app):
+    """Connection class ``db.get_db`` should use for this app."""
+    return ProfiledConnection if app.config.get("SQL_PROFILE") else sqlite3.Connection
+
+
+def request_profile():
+    """QueryProfile of the current request's connection, or None if it is not profiled."""
+    conn = g.get("_database")
+    return getattr(conn, "profile", None)
+
+
+def _compact(sql):
+    return " ".join(sql.split())
+
+
+def report_request_sql(response):
+    """after_request hook: slow-query log, N+1 warning and Server-Timing header."""
+    profile = request_profile()
+    if profile is None or not profile.count:
+        return response
+    config = current_app.config
+    conn = g._database
+
+    slow_seconds = config["SQL_SLOW_MS"] / 1000
+    for seconds, sql, params in profile.slowest():
+        if seconds < slow_seconds:
+            break
+        plan = "\n    ".join(conn.explain(sql, params))
+        log.warning("Slow query (%.1f ms) in %s %s: %s\n  params: %r\n  plan:\n    %s",
+                    seconds * 1000, request.method, request.path, _compact(sql), params, plan)
+
+    for sql, executions in profile.repeated(config["SQL_N_PLUS_ONE_THRESHOLD"]):
+        log.warning("Possible N+1 in %s %s: statement ran %d times: %s",
+                    request.method, request.path, executions, _compact(sql))
+
+    log.debug("%s %s: %d queries, %.1f ms SQL", request.method, request.path, profile.count, profile.total * 1000)
+    if config["SQL_SERVER_TIMING"]:
+        response.headers.add(
+            "Server-Timing", f'db;dur={profile.total * 1000:.1f};desc="{profile.count} queries"'
+        )
+    return response
+
+
+def init_sql_profiler(app):
+    """Profile per-request SQL on the app's get_db connections."""
+    app.config.setdefault("SQL_PROFILE", True)
+    app.config.setdefault("SQL_SLOW_MS", 100)
+    app.config.setdefault("SQL_N_PLUS_ONE_THRESHOLD", 5)
+    app.config.setdefault("SQL_SERVER_TIMING", False)
+    app.after_request(report_request_sql)
@@ -0,0 +1,58 @@
+"""
+Streamed page rendering for long listings (order history, admin orders).
+
+``stream_page`` renders a template with ``flask.stream_template`` and
+returns the output as it is produced, so the page header goes out before
+the rows are read. Jinja yields many small pieces. They are joined into
+chunks of about ``STREAM_CHUNK_BYTES`` so that each chunk costs one write
+(and one compressor flush, see compression.py) rather than one per piece.
+
+Give the template a generator, for example one over a repository cursor,
+and loop over it with ``{% for %}...{% else %}...{% endfor %}``. A
+generator is always truthy, so ``{% if rows %}`` cannot tell that it is
+empty.
+
+Teardown handlers run once when the view returns and again when the
+stream ends. ``close_db`` drops the first connection, so the generator
+should call ``get_repository()`` (or ``get_db()``) once it starts
+running. It then gets a connection that stays open for the rest of the
+stream. Request metrics time the view up to the response headers.
+
+Set ``STREAM_TEMPLATES = False`` to render the whole page before sending
+it. The same generator is then consumed by ``render_template``.
+"""
+
+from flask import Response, current_app, get_flashed_messages, render_template, stream_template
+
+DEFAULT_CHUNK_BYTES = 16 * 1024
+
+
+def _chunked(pieces, size):
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_page(template_name, **context):
+    """Like render_template, but send the page in chunks while it renders."""
+    config = current_app.config
+    if not config["STREAM_TEMPLATES"]:
+        return render_template(template_name, **context)
+    # The session cookie is written before the body streams. Take the flashed
+    # messages now so showing them still removes them from the session.
+    get_flashed_messages(with_categories=True)
+    pieces = stream_template(template_name, **context)
+    return Response(_chunked(pieces, config["STREAM_CHUNK_BYTES"]), mimetype="text/html")
+
+
+def init_streaming(app):
+    app.config.setdefault("STREAM_TEMPLATES", True)
+    app.config.setdefault("STREAM_CHUNK_BYTES", DEFAULT_CHUNK_BYTES)
@@ -0,0 +1,99 @@
+"""
+Jinja bytecode cache and template precompilation.
+
+Compiling a template (lexing, parsing, generating and compiling Python
+source) is the expensive part of its first render. Without help, every
+worker pays for it again on the first request to each page after a deploy
+or a scale-out.
+
+* A ``FileSystemBytecodeCache`` in ``TEMPLATE_CACHE_DIR`` keeps the
+  compiled code of every template on disk. The cache key includes a
+  checksum of the template source, so an edited template is compiled
+  again. Workers then only unmarshal code that an earlier process or the
+  ``precompile-templates`` command compiled.
+* ``TEMPLATE_WARMUP`` (on by default) loads every template under
+  ``templates/``, ``partials/`` included, when the app is created. Under
+  gunicorn the app is preloaded in the master, so workers fork with all
+  templates already in ``jinja_env`` and start without compiling any.
+
+The warm-up logs how many templates came from the bytecode cache and how
+long loading them took. ``bench/templates.py`` compares a cold compile,
+a bytecode cache load and a warm environment.
+"""
+
+import getpass
+import logging
+import os
+import tempfile
+import time
+
+import click
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+log = logging.getLogger(__name__)
+
+
+class CountingBytecodeCache(FileSystemBytecodeCache):
+    """FileSystemBytecodeCache that counts loads served from disk."""
+
+    def __init__(self, directory=None, pattern="__jinja2_%s.cache"):
+        super().__init__(directory, pattern)
+        self.hits = 0
+        self.misses = 0
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+
+def default_cache_dir():
+    # One directory per user; Windows has no os.getuid()
+    user = os.getuid() if hasattr(os, "getuid") else getpass.getuser()
+    return os.path.join(tempfile.gettempdir(), f"furnishfusion-jinja-{user}")
+
+
+def warm_templates(app):
+    """Load every template of ``app`` into its environment. Returns (count, seconds)."""
+    env = app.jinja_env
+    started = time.perf_counter()
+    count = 0
+    for name in env.list_templates():
+        try:
+            env.get_template(name)
+        except TemplateSyntaxError as e:
+            log.warning("Template %s does not compile: %s", name, e)
+            continue
+        count += 1
+    return count, time.perf_counter() - started
+
+
+def init_template_cache(app):
+    """Give the app a persistent bytecode cache and precompile its templates.
+
+    Call it after everything that adds template globals, so the warm-up
+    runs on the finished environment.
+    """
+    app.config.setdefault("TEMPLATE_CACHE_DIR", os.environ.get("TEMPLATE_CACHE_DIR") or default_cache_dir())
+    app.config.setdefault("TEMPLATE_WARMUP", os.environ.get("TEMPLATE_WARMUP", "1") != "0")
+
+    directory = app.config["TEMPLATE_CACHE_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    cache = CountingBytecodeCache(directory)
+    app.jinja_env.bytecode_cache = cache
+
+    if app.config["TEMPLATE_WARMUP"]:
+        count, seconds = warm_templates(app)
+        log.info("Precompiled %d templates in %.1f ms (%d from the bytecode cache)",
+                 count, seconds * 1000, cache.hits)
+
+    @app.cli.command("precompile-templates")
+    def precompile_templates_command():
+        """Compile every template into the bytecode cache (e.g. while building the image)."""
+        env = app.jinja_env
+        env.cache.clear()  # compile again even if the warm-up just loaded them
+        cache.clear()
+        count, seconds = warm_templates(app)
+        click.echo(f"Compiled {count} templates into {directory} in {seconds * 1000:.1f} ms")
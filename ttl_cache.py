@@ -0,0 +1,73 @@
+"""
+Small thread-safe TTL + LRU cache used as a read-through layer in front of
+slow backends (DynamoDB tables in app_aws).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_LOOKUPS
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60.0, name="cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]  # expired
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for ``key`` or call ``loader()`` and cache a non-None result."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:  # never cache misses; the item may be created elsewhere
+                self.set(key, value)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,273 @@
+"""
+Content-addressed storage for files under static/uploads.
+
+Multipart file parts are written straight into the upload folder while the
+request body is parsed (``UploadRequest``); the first bytes are sniffed for
+an image signature and the part is rejected as soon as it turns out to be
+the wrong type or too large. Finished uploads have their EXIF/XMP metadata
+stripped (``image_pipeline.strip_metadata``) and are renamed to the
+``<sha256>.<ext>`` of the stored bytes, so identical files share one copy,
+names never collide, and the URLs can be cached forever. Files that no product, UPI QR
+or order references any more are removed by ``gc_uploads`` (exposed as
+``flask --app app gc-uploads``).
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import uuid
+
+import click
+from flask import Request, current_app, flash, redirect, request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from db import DATABASE
+from image_pipeline import is_variant, strip_metadata, variant_stem
+from metrics import UPLOAD_BYTES, UPLOADS
+
+HASH_LENGTH = 32  # hex chars of the SHA-256 kept in the filename (128 bits)
+CHUNK_SIZE = 64 * 1024
+INCOMING_PREFIX = ".incoming-"
+GC_GRACE_SECONDS = 3600  # leave fresh files alone; their row may not be committed yet
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+# Magic bytes -> stored extension. WebP is "RIFF<size>WEBP".
+SNIFF_BYTES = 12
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+
+_HASHED_NAME_RE = re.compile(r"^uploads/[0-9a-f]{%d}(_\d+w)?\.[a-z0-9]+$" % HASH_LENGTH)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+
+def sniff_image_type(head):
+    """Return the extension for an image signature at the start of ``head``, or None."""
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class IncomingUpload:
+    """
+    Writable/readable stream that lands a file part directly in the upload folder.
+    The type is checked on the first bytes and the size on every write, so a bad
+    upload is refused before the rest of the body is read.
+    """
+
+    def __init__(self, upload_folder, max_bytes):
+        os.makedirs(upload_folder, exist_ok=True)
+        self.upload_folder = upload_folder
+        self.path = os.path.join(upload_folder, INCOMING_PREFIX + uuid.uuid4().hex)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.kind = None
+        self.finalized = False
+        self._head = b""
+        self._digest = hashlib.sha256()
+        self._file = open(self.path, "w+b")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Upload is larger than {self.max_bytes // (1024 * 1024)} MB.")
+        if self.kind is None:
+            self._head += data[:SNIFF_BYTES]
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_type()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def _check_type(self):
+        self.kind = sniff_image_type(self._head)
+        if self.kind is None:
+            raise UnsupportedMediaType("Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP")
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+    def finalize(self):
+        """Move the completed upload to its content-addressed name and return that name."""
+        if self.kind is None:
+            self._check_type()  # files shorter than SNIFF_BYTES
+        self._file.close()
+        try:
+            stripped = strip_metadata(self.path)
+        except Exception as e:
+            raise UnsupportedMediaType("The image could not be read.") from e
+        # A stripped file is named after the bytes that are stored, not the ones uploaded
+        digest = _file_digest(self.path) if stripped else self._digest
+        filename = f"{digest.hexdigest()[:HASH_LENGTH]}.{self.kind}"
+        final = os.path.join(self.upload_folder, filename)
+        try:
+            # Duplicate: keep the copy we already have, but touch it first. gc_uploads
+            # goes by mtime, so the file then counts as fresh until our row is committed.
+            os.utime(final)
+        except FileNotFoundError:
+            os.replace(self.path, final)
+            UPLOADS.inc(result="stored")
+            UPLOAD_BYTES.inc(self.size, kind=self.kind)
+        else:
+            os.remove(self.path)
+            UPLOADS.inc(result="duplicate")
+        self.finalized = True
+        return filename
+
+    def discard(self):
+        self._file.close()
+        if not self.finalized and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _upload_max_bytes():
+    return current_app.config.get("UPLOAD_MAX_BYTES", DEFAULT_UPLOAD_MAX_BYTES)
+
+
+class UploadRequest(Request):
+    """Request class whose file parts are streamed into IncomingUpload objects."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            # Empty <input type="file">: nothing to store
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if content_length and content_length > _upload_max_bytes():
+            raise RequestEntityTooLarge()
+        incoming = IncomingUpload(current_app.config["UPLOAD_FOLDER"], _upload_max_bytes())
+        if not hasattr(self, "_incoming_uploads"):
+            self._incoming_uploads = []
+        self._incoming_uploads.append(incoming)
+        return incoming
+
+
+def store_upload(file_storage, upload_folder):
+    """Finish storing an uploaded image and return its content-addressed filename.
+
+    Raises UnsupportedMediaType / RequestEntityTooLarge for invalid uploads.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, IncomingUpload):
+        return stream.finalize()
+
+    # Parsed by something other than UploadRequest: copy through the same checks
+    incoming = IncomingUpload(upload_folder, _upload_max_bytes())
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            incoming.write(chunk)
+        return incoming.finalize()
+    finally:
+        incoming.discard()
+
+
+def discard_incoming_uploads(exc=None):
+    """teardown_request hook: remove file parts the view never stored."""
+    for incoming in getattr(request, "_incoming_uploads", ()):
+        incoming.discard()
+
+
+def handle_rejected_upload(error):
+    """Turn an early upload rejection into the usual flash + redirect for HTML forms."""
+    UPLOADS.inc(result="rejected")
+    if request.method != "POST" or not request.accept_mimetypes.accept_html:
+        return error
+    flash(error.description, "error")
+    return redirect(request.referrer or request.path)
+
+
+def add_cache_headers(response):
+    """after_request hook: content-addressed upload URLs never change, so cache them for a year."""
+    if request.endpoint == "static" and response.status_code in (200, 304):
+        filename = (request.view_args or {}).get("filename", "")
+        if _HASHED_NAME_RE.match(filename):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def referenced_filenames(db):
+    """Basenames under static/uploads that the database still points at."""
+    rows = db.execute(
+        """SELECT image_url AS url FROM products
+           UNION SELECT image_url FROM upi_qr
+           UNION SELECT payment_proof_url FROM orders"""
+    ).fetchall()
+    names = set()
+    for row in rows:
+        url = row["url"] or ""
+        if "/uploads/" in url:
+            names.add(url.rsplit("/", 1)[-1])
+    return names
+
+
+def gc_uploads(db, upload_folder, grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+    """Delete uploads (and their variants) no row references. Returns the removed filenames."""
+    referenced_stems = {os.path.splitext(name)[0] for name in referenced_filenames(db)}
+    cutoff = time.time() - grace_seconds
+    removed = []
+    for name in sorted(os.listdir(upload_folder)):
+        path = os.path.join(upload_folder, name)
+        if not os.path.isfile(path) or os.path.getmtime(path) > cutoff:
+            continue
+        if name.startswith(INCOMING_PREFIX):
+            stale = True  # abandoned partial upload
+        else:
+            stem = variant_stem(name) if is_variant(name) else os.path.splitext(name)[0]
+            stale = stem not in referenced_stems
+        if stale:
+            removed.append(name)
+            if not dry_run:
+                os.remove(path)
+    return removed
+
+
+def init_upload_store(app):
+    """Install the streaming request class, upload hooks and the gc-uploads CLI command."""
+    app.config.setdefault("UPLOAD_MAX_BYTES", DEFAULT_UPLOAD_MAX_BYTES)
+    app.request_class = UploadRequest
+    app.teardown_request(discard_incoming_uploads)
+    app.register_error_handler(RequestEntityTooLarge, handle_rejected_upload)
+    app.register_error_handler(UnsupportedMediaType, handle_rejected_upload)
+    app.after_request(add_cache_headers)
+
+    @app.cli.command("gc-uploads")
+    @click.option("--dry-run", is_flag=True, help="List unreferenced files without deleting them.")
+    def gc_uploads_command(dry_run):
+        """Remove uploads that no product, UPI QR or order references."""
+        conn = sqlite3.connect(DATABASE)
+        conn.row_factory = sqlite3.Row
+        try:
+            removed = gc_uploads(conn, app.config["UPLOAD_FOLDER"], dry_run=dry_run)
+        finally:
+            conn.close()
+        for name in removed:
+            print(("would remove " if dry_run else "removed ") + name)
+        print(f"{len(removed)} file(s) {'unreferenced' if dry_run else 'removed'}")